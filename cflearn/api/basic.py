@@ -194,6 +194,7 @@ def finetune(
     *,
     new_model: Optional[str] = None,
     strict: bool = True,
+    freeze_extractors: bool = False,
     load_increment: bool = True,
     identifier: str = "cflearn",
     pretrain_folder: Optional[str] = None,
@@ -203,6 +204,11 @@ def finetune(
     sample_weights: Optional[np.ndarray] = None,
     cuda: Optional[Union[int, str]] = None,
 ) -> Pipeline:
+    if freeze_extractors:
+        increment_config = update_dict(
+            {"model_config": {"freeze_extractors": True}},
+            _parse_config(increment_config),
+        )
     ms = make_from(
         identifier,
         pretrain_folder,
@@ -363,6 +369,7 @@ def save(
     saving_folder: Optional[str] = None,
     *,
     compress: bool = True,
+    mmap_data: bool = False,
 ) -> Dict[str, List[Pipeline]]:
     pipeline_dict = _to_pipelines(pipelines)
     saving_path = _to_saving_path(identifier, saving_folder)
@@ -371,6 +378,7 @@ def save(
             pipeline.save(
                 _make_saving_path(i, name, saving_path, True),
                 compress=compress,
+                mmap_data=mmap_data,
             )
     return pipeline_dict
 
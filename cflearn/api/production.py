@@ -140,6 +140,8 @@ class Pack(LoggingMixin):
         pack_data: bool = True,
         retain_data: bool = False,
         remove_original: bool = True,
+        mmap_data: bool = False,
+        dndf_top_k: Optional[int] = None,
         **kwargs: Any,
     ) -> None:
         kwargs = shallow_copy_dict(kwargs)
@@ -151,7 +153,7 @@ class Pack(LoggingMixin):
             model = pipeline.model
             if model is None:
                 raise ValueError("`model` is not generated yet")
-            with model.export_context():
+            with model.export_context(dndf_top_k=dndf_top_k):
                 onnx = ONNX(model=model)
                 onnx.to_onnx(instance.onnx_path, **shallow_copy_dict(kwargs))
             with open(instance.onnx_output_names_path, "w") as f:
@@ -163,6 +165,7 @@ class Pack(LoggingMixin):
                 save_data=pack_data,
                 retain_data=retain_data,
                 compress=False,
+                mmap_data=mmap_data,
             )
             with open(instance.binary_config_path, "w") as f:
                 trainer = pipeline.trainer
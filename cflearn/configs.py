@@ -114,6 +114,7 @@ class Elements(NamedTuple):
     max_snapshot_file: int = 5
     clip_norm: float = 0.0
     ema_decay: float = 0.0
+    ema_update_every: int = 1
     model_config: Optional[Dict[str, Any]] = None
     loss: str = "auto"
     loss_config: Optional[Dict[str, Any]] = None
@@ -238,6 +239,7 @@ class Elements(NamedTuple):
         model_config["aggregator"] = kwargs.pop("aggregator")
         model_config["aggregator_config"] = kwargs.pop("aggregator_config") or {}
         model_config["ema_decay"] = kwargs.pop("ema_decay")
+        model_config["ema_update_every"] = kwargs.pop("ema_update_every")
         model_config["loss"] = kwargs.pop("loss")
         model_config["loss_config"] = kwargs.pop("loss_config") or {}
         default_encoding_init_method = kwargs.pop("default_encoding_init_method")
@@ -320,6 +322,10 @@ class Elements(NamedTuple):
         kwargs.setdefault("binary_config", {})
         kwargs.setdefault("shuffle_tr", True)
         kwargs.setdefault("cv_batch_size", 512)
+        if kwargs.get("rank") is not None:
+            kwargs.setdefault("sampler_protocol", "tabular_ddp")
+        kwargs.setdefault("data_residency", "host")
+        kwargs.setdefault("data_cache_folder", None)
         kwargs.setdefault("ts_label_collator_config", {})
         log_folder = kwargs.setdefault("logging_folder", os.path.join("_logs", model))
         log_file = kwargs.get("logging_file")
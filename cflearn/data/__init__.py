@@ -1,4 +1,13 @@
 from .core import *
+from .stream import *
 
 
-__all__ = ["TabularData", "TabularLoader", "TabularSampler"]
+__all__ = [
+    "TabularData",
+    "TabularLoader",
+    "TabularSampler",
+    "TabularDDPSampler",
+    "TabularStreamData",
+    "TabularStreamLoader",
+    "TabularStreamSampler",
+]
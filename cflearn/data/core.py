@@ -1,26 +1,468 @@
+import os
 import copy
+import math
+import dill
 import torch
+import logging
 
 import numpy as np
 
+from typing import *
 from cftool.misc import update_dict
+from cftool.misc import lock_manager
 from cftool.misc import shallow_copy_dict
+from cftool.misc import timing_context
+from cftool.misc import Saving
+from concurrent.futures import ProcessPoolExecutor
 from cfdata.types import np_int_type
 from cfdata.types import np_float_type
 from cfdata.tabular import DataLoader
+from cfdata.tabular import ColumnTypes
 from cfdata.tabular import ImbalancedSampler
+from cfdata.tabular import DataTuple
 from cfdata.tabular import TabularData as TD
+from cfdata.tabular.recognizer import Recognizer
+from cfdata.tabular.converters import Converter
+from cfdata.tabular.processors import Processor
+from cfdata.tabular.processors import processor_dict
 
+from ..types import data_type
+from ..types import tensor_dict_type
 from ..types import loader_batch_type
+from ..protocol import DataSplit
 from ..protocol import DataProtocol
 from ..protocol import SamplerProtocol
 from ..protocol import DataLoaderProtocol
 from ..misc.toolkit import to_torch
 
 
+def _fit_recognizer(kwargs: Dict[str, Any], frame: Any, is_preset: bool) -> Recognizer:
+    return Recognizer(**kwargs).fit(frame, is_preset=is_preset)
+
+
 @DataProtocol.register("tabular")
 class TabularData(TD, DataProtocol):
-    pass
+    """
+    `TabularData` which could be saved into a memory-mappable layout.
+
+    * if `num_jobs` > 1, column recognizers will be fitted with a process pool.
+      Results are gathered in column order, so they are identical to the serial
+      ones. cfdata builds recognizers inline in `_core_fit`, so the parallel
+      path mirrors that method of carefree-data 0.2.x (see `setup.py`) and
+      should be kept in sync with it. `num_jobs` = 1 delegates to cfdata.
+    * if `view_split` is True, `split` will return views which only hold the
+      parent data & the row indices, and rows will be gathered lazily.
+
+    """
+
+    mmap_folder = "__mmap__"
+
+    _view_parent: Optional["TabularData"] = None
+    _view_indices: Optional[np.ndarray] = None
+
+    def __init__(
+        self,
+        *,
+        num_jobs: int = 1,
+        view_split: bool = False,
+        **kwargs: Any,
+    ):
+        super().__init__(**kwargs)
+        self.num_jobs = num_jobs
+        self.view_split = view_split
+
+    def __len__(self) -> int:
+        if self._view_indices is None:
+            return super().__len__()
+        return len(self._view_indices)
+
+    def __getitem__(
+        self,
+        indices: np.ndarray,
+    ) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        if self._view_parent is None or self._view_indices is None:
+            return super().__getitem__(indices)
+        return self._view_parent[self._view_indices[indices]]
+
+    # view
+
+    @property
+    def is_view(self) -> bool:
+        return self._view_parent is not None
+
+    def _view_tuple(self, attr: str) -> Optional[DataTuple]:
+        if self._view_parent is None or self._view_indices is None:
+            return getattr(self, f"_{attr}")
+        data_tuple = getattr(self._view_parent, attr)
+        if data_tuple is None:
+            return None
+        return data_tuple.split_with(self._view_indices)
+
+    @property
+    def raw(self) -> Optional[DataTuple]:
+        return self._view_tuple("raw")
+
+    @property
+    def converted(self) -> Optional[DataTuple]:
+        return self._view_tuple("converted")
+
+    @property
+    def processed(self) -> Optional[DataTuple]:
+        return self._view_tuple("processed")
+
+    @property
+    def processed_dim(self) -> int:
+        if self._view_parent is None:
+            return super().processed_dim
+        return self._view_parent.processed_dim
+
+    def _make_view(self, indices: np.ndarray) -> "TabularData":
+        view = copy.copy(self)
+        view._raw = view._converted = view._processed = None
+        if self._view_parent is None or self._view_indices is None:
+            view._view_parent, view._view_indices = self, indices
+        else:
+            view._view_indices = self._view_indices[indices]
+        view.ts_sorting_indices = np.arange(len(indices))
+        return view
+
+    def materialize(self) -> "TabularData":
+        if not self.is_view:
+            return self
+        materialized = copy.copy(self)
+        materialized._raw = self.raw
+        materialized._converted = self.converted
+        materialized._processed = self.processed
+        materialized._view_parent = materialized._view_indices = None
+        # converters are shared with the parent after `copy.copy`, so they should
+        # be copied before their converted features are replaced
+        materialized.converters = {
+            idx: None if converter is None else copy.copy(converter)
+            for idx, converter in self.converters.items()
+        }
+        materialized._inject_converted_features()
+        return materialized
+
+    def split_with_indices(
+        self,
+        split_indices: np.ndarray,
+        remained_indices: np.ndarray,
+    ) -> DataSplit:
+        if not self.view_split:
+            return super().split_with_indices(split_indices, remained_indices)
+        return DataSplit(
+            self._make_view(split_indices),
+            self._make_view(remained_indices),
+            split_indices,
+            remained_indices,
+        )
+
+    def copy_to(
+        self,
+        x: Union[str, data_type],
+        y: data_type = None,
+        *,
+        contains_labels: bool = True,
+    ) -> "TabularData":
+        copied = super().copy_to(x, y, contains_labels=contains_labels)
+        copied._view_parent = copied._view_indices = None
+        return copied
+
+    def _column_name(self, i: int) -> str:
+        return self.column_names[i if i < self.label_idx else i + 1]
+
+    def _recognizer_kwargs(
+        self,
+        i: int,
+        is_valid: Optional[bool],
+        labels: Optional[np.ndarray],
+    ) -> Dict[str, Any]:
+        return dict(
+            name=self._column_name(i),
+            is_np=self._is_np,
+            is_label=False,
+            is_valid=is_valid,
+            task_type=self.task_type,
+            binning=self._binning_method,
+            labels=labels,
+            config=self._recognizer_configs.setdefault(i, {}),
+        )
+
+    def _fit_recognizers(
+        self,
+        columns: List[int],
+        is_valid_list: List[Optional[bool]],
+        labels: Optional[np.ndarray],
+    ) -> List[Recognizer]:
+        # recognizers are fitted in pure python, so a process pool is used to
+        # bypass the GIL, and results are gathered in column order
+        assert self._x_df is not None
+        kwargs_list = [
+            self._recognizer_kwargs(i, is_valid, labels)
+            for i, is_valid in zip(columns, is_valid_list)
+        ]
+        frames = [self._x_df[:, i] for i in columns]
+        is_preset_list = [i in self._preset_stypes for i in columns]
+        num_jobs = min(self.num_jobs, len(columns))
+        if num_jobs <= 1:
+            recognizers = list(
+                map(_fit_recognizer, kwargs_list, frames, is_preset_list)
+            )
+        else:
+            chunksize = math.ceil(len(columns) / num_jobs)
+            with ProcessPoolExecutor(num_jobs) as executor:
+                recognizers = list(
+                    executor.map(
+                        _fit_recognizer,
+                        kwargs_list,
+                        frames,
+                        is_preset_list,
+                        chunksize=chunksize,
+                    )
+                )
+        # configs are updated in the workers, so they are synced back here
+        for i, recognizer in zip(columns, recognizers):
+            self._recognizer_configs[i] = recognizer.config
+        return recognizers
+
+    def _core_fit(self) -> "TabularData":
+        if self.num_jobs <= 1 or self._simplify:
+            return super()._core_fit()
+        # mirrors `cfdata.tabular.TabularData._core_fit` (carefree-data 0.2.x),
+        # except that feature recognizers are fitted with `_fit_recognizers`
+        if self._raw is None or self._raw.x is None:
+            raise ValueError("`_raw.x` is not provided")
+        if self._x_df is None:
+            raise ValueError("`_x_df` is required in `_core_fit`")
+        self._raw_dim = len(self._raw.x[0])
+        ts_indices = self.ts_indices
+        self.recognizers, self.converters = {}, {}
+        # convert labels
+        if self._raw.y is None:
+            converted_labels = None
+            self.recognizers[-1] = None
+            self.converters[-1] = None
+        else:
+            with timing_context(self, "fit recognizer", enable=self._timing):
+                recognizer = self._inject_label_recognizer()
+            with timing_context(self, "fit converter", enable=self._timing):
+                converter = Converter.make_with(recognizer)
+                self.converters[-1] = converter
+            with timing_context(self, "convert", enable=self._timing):
+                converted_labels = converter.converted_input.reshape([-1, 1])
+
+        # recognize features
+        def _is_valid(i: int) -> Optional[bool]:
+            if i in self._valid_columns:
+                return True
+            if i in self._invalid_columns:
+                return False
+            return None
+
+        columns = list(range(self.raw_dim))
+        with timing_context(self, "fit recognizer", enable=self._timing):
+            recognizers = self._fit_recognizers(
+                columns,
+                list(map(_is_valid, columns)),
+                converted_labels,
+            )
+        # the last column is forced to be valid if all previous ones are excluded,
+        # columns which are both preset to be excluded and invalid count once
+        last = self.raw_dim - 1
+        excluded = set(self.excludes)
+        excluded.update(i for i in columns[:last] if not recognizers[i].info.is_valid)
+        if last == len(excluded):
+            if last > 0:
+                self.log_msg(
+                    f"last column {self._column_name(last)} is forced to be valid "
+                    "because previous columns are all excluded",
+                    self.warning_prefix,
+                    verbose_level=2,
+                    msg_level=logging.WARNING,
+                )
+            recognizers[last] = self._fit_recognizers([last], [True], converted_labels)[
+                0
+            ]
+        # convert features
+        converted_features = []
+        for i, recognizer in zip(columns, recognizers):
+            self.recognizers[i] = recognizer
+            if not recognizer.info.is_valid:
+                msg = recognizer.info.msg
+                self.log_msg(msg, self.warning_prefix, 2, logging.WARNING)
+                self.excludes.add(i)
+                continue
+            if i not in ts_indices:
+                with timing_context(self, "fit converter", enable=self._timing):
+                    converter = Converter.make_with(recognizer)
+                    self.converters[i] = converter
+                with timing_context(self, "convert", enable=self._timing):
+                    converted = converter.converted_input.astype(np_float_type)
+                    converted_features.append(converted)
+        converted_x = np.vstack(converted_features).T
+        # process features
+        self.processors = {}
+        processed_features = []
+        previous_processors: List[Processor] = []
+        idx = 0
+        while idx < self.raw_dim:
+            if idx in self.excludes or idx in ts_indices:
+                idx += 1
+                continue
+            local_converter = self.converters[idx]
+            assert local_converter is not None
+            column_type = local_converter.info.column_type
+            if self._process_methods is None:
+                method = None
+            elif isinstance(self._process_methods, str):
+                method = self._process_methods
+            else:
+                method = self._process_methods.get(idx, "auto")
+            if method is None:
+                method = "identical"
+            elif method == "auto":
+                if column_type is ColumnTypes.NUMERICAL:
+                    method = self._default_numerical_process
+                else:
+                    method = self._default_categorical_process
+            processor = processor_dict[method].make_with(previous_processors.copy())
+            previous_processors.append(processor)
+            self.processors[idx] = processor
+            local_columns = converted_x[..., processor.input_indices]
+            with timing_context(self, "fit processor", enable=self._timing):
+                processor.fit(local_columns)
+            with timing_context(self, "process", enable=self._timing):
+                processed_features.append(processor.process(local_columns))
+            idx += processor.input_dim
+        # process labels
+        if converted_labels is None:
+            processed_labels = self.processors[-1] = None
+        else:
+            label_converter = self.converters[-1]
+            assert label_converter is not None
+            method = self._label_process_method
+            if method is None:
+                column_type = label_converter.info.column_type
+                if column_type is ColumnTypes.NUMERICAL:
+                    method = "normalize"
+                else:
+                    method = "identical"
+            with timing_context(self, "fit processor", enable=self._timing):
+                processor = processor_dict[method].make_with([])
+                self.processors[-1] = processor.fit(converted_labels)
+            with timing_context(self, "process", enable=self._timing):
+                processed_labels = processor.process(converted_labels)
+            if self.task_type.is_clf:
+                converted_labels = converted_labels.astype(np_int_type)
+                processed_labels = processed_labels.astype(np_int_type)
+        self._converted = DataTuple(converted_x, converted_labels)
+        self._processed = DataTuple(np.hstack(processed_features), processed_labels)
+        self.ts_sorting_indices = None
+        if self.is_ts:
+            self._get_ts_sorting_indices()
+        if not self.is_reg and processed_labels is not None:
+            self._num_classes = processed_labels.max().item() + 1
+        return self
+
+    def _inject_converted_features(self) -> None:
+        converted = self._converted
+        if self._simplify or converted is None:
+            return None
+        indices = [idx for idx in sorted(self.converters) if idx != -1]
+        for i, idx in enumerate(indices):
+            converter = self.converters[idx]
+            assert converter is not None
+            converter._converted_features = converted.x[..., i]
+        label_converter = self.converters[-1]
+        if label_converter is not None and isinstance(converted.y, np.ndarray):
+            label_converter._converted_features = converted.y.flatten()
+
+    def save(
+        self,
+        folder: str,
+        *,
+        compress: bool = True,
+        retain_data: bool = True,
+        remove_original: bool = True,
+        mmap: bool = False,
+    ) -> "TabularData":
+        if self.is_view:
+            self.materialize().save(
+                folder,
+                compress=compress,
+                retain_data=retain_data,
+                remove_original=remove_original,
+                mmap=mmap,
+            )
+            return self
+        if not mmap:
+            super().save(
+                folder,
+                compress=compress,
+                retain_data=retain_data,
+                remove_original=remove_original,
+            )
+            return self
+        # metadata & data structures are saved without data, and the data tuples
+        # are saved as raw `.npy` blocks so they can be memory-mapped when loading
+        super().save(folder, compress=False, retain_data=False)
+        abs_folder = os.path.abspath(folder)
+        base_folder = os.path.dirname(abs_folder)
+        with lock_manager(base_folder, [folder]):
+            mmap_folder = os.path.join(abs_folder, self.mmap_folder)
+            os.makedirs(mmap_folder)
+            for attr in self.data_tuple_attributes:
+                data_tuple = getattr(self, attr)
+                if data_tuple is None:
+                    continue
+                for field, value in zip(data_tuple._fields, data_tuple):
+                    if value is None:
+                        continue
+                    prefix = os.path.join(mmap_folder, f"{attr}.{field}")
+                    if isinstance(value, np.ndarray) and value.dtype != object:
+                        np.save(f"{prefix}.npy", value)
+                    else:
+                        with open(f"{prefix}.pkl", "wb") as f:
+                            dill.dump(value, f)
+            if compress:
+                Saving.compress(abs_folder, remove_original=remove_original)
+        return self
+
+    @classmethod
+    def load(
+        cls,
+        folder: str,
+        *,
+        compress: bool = True,
+        verbose_level: int = 0,
+    ) -> "TabularData":
+        abs_folder = os.path.abspath(folder)
+        base_folder = os.path.dirname(abs_folder)
+        with Saving.compress_loader(folder, compress, remove_extracted=True):
+            data = super().load(folder, compress=False, verbose_level=verbose_level)
+            mmap_folder = os.path.join(abs_folder, cls.mmap_folder)
+            if not os.path.isdir(mmap_folder):
+                return data
+            # extracted files will be removed, so they should not be mapped
+            mmap_mode = None if compress else "r"
+            with lock_manager(base_folder, [folder]):
+                for attr in data.data_tuple_attributes:
+                    values: Dict[str, Any] = {}
+                    for field in DataTuple._fields:
+                        prefix = os.path.join(mmap_folder, f"{attr}.{field}")
+                        if os.path.isfile(f"{prefix}.npy"):
+                            values[field] = np.load(
+                                f"{prefix}.npy",
+                                mmap_mode=mmap_mode,
+                            )
+                        elif os.path.isfile(f"{prefix}.pkl"):
+                            with open(f"{prefix}.pkl", "rb") as f:
+                                values[field] = dill.load(f)
+                    if "x" in values:
+                        x, y, xT = map(values.get, DataTuple._fields)
+                        setattr(data, attr, DataTuple(x, y, xT))
+            data._inject_converted_features()
+        return data
 
 
 @SamplerProtocol.register("tabular")
@@ -28,9 +470,250 @@ class TabularSampler(ImbalancedSampler, SamplerProtocol):
     pass
 
 
+@SamplerProtocol.register("tabular_ddp")
+class TabularDDPSampler(TabularSampler):
+    """
+    `TabularSampler` which partitions the (shuffled) indices across ranks.
+
+    * indices of each epoch are generated with `seed + epoch` on every rank, so
+      all ranks share the same permutation and take disjoint slices of it.
+    * `epoch` should be updated explicitly with `set_epoch`, which is called by
+      the trainer at the start of every epoch.
+    * indices are padded (or dropped, if `drop_last` is True) so that every rank
+      holds the same number of samples.
+    * when `shuffle` is False (e.g. caches & validation), all indices will be
+      returned in order, because they are accessed with global indices.
+
+    """
+
+    is_distributed = True
+
+    def __init__(
+        self,
+        data: TD,
+        imbalance_threshold: float = 0.1,
+        *,
+        rank: int = 0,
+        world_size: int = 1,
+        seed: int = 0,
+        drop_last: bool = False,
+        **kwargs: Any,
+    ):
+        if not 0 <= rank < world_size:
+            raise ValueError(f"rank {rank} is invalid for world size {world_size}")
+        super().__init__(data, imbalance_threshold, **kwargs)
+        self.rank = rank
+        self.world_size = world_size
+        self.seed = seed
+        self.drop_last = drop_last
+        self.epoch = 0
+        self._kwargs = kwargs
+
+    def __len__(self) -> int:
+        num_samples = super().__len__()
+        if not self.shuffle:
+            return num_samples
+        if self.drop_last:
+            return num_samples // self.world_size
+        return int(math.ceil(num_samples / self.world_size))
+
+    def set_epoch(self, epoch: int) -> None:
+        self.epoch = epoch
+
+    def get_indices(self) -> np.ndarray:
+        if not self.shuffle:
+            return super().get_indices()
+        state = np.random.get_state()
+        np.random.seed(self.seed + self.epoch)
+        try:
+            indices = super().get_indices()
+        finally:
+            np.random.set_state(state)
+        total = len(self) * self.world_size
+        if total <= len(indices):
+            indices = indices[:total]
+        else:
+            num_repeat = int(math.ceil(total / len(indices)))
+            indices = np.tile(indices, num_repeat)[:total]
+        return indices[self.rank :: self.world_size]
+
+    def copy(self) -> "TabularDDPSampler":
+        kwargs = shallow_copy_dict(self._kwargs)
+        kwargs["shuffle"] = self.shuffle
+        kwargs["verbose_imbalance"] = False
+        if self.sample_weights is not None:
+            kwargs["sample_weights"] = self.sample_weights.copy()
+        copied = TabularDDPSampler(
+            self.data,
+            self.imbalance_threshold,
+            rank=self.rank,
+            world_size=self.world_size,
+            seed=self.seed,
+            drop_last=self.drop_last,
+            **kwargs,
+        )
+        copied.epoch = self.epoch
+        return copied
+
+
 @DataLoaderProtocol.register("tabular")
 class TabularLoader(DataLoader, DataLoaderProtocol):
+    """
+    `DataLoader` which yields torch batches.
+
+    * if `use_feature_store` is True, the processed `x` & `y` will be cast into
+      contiguous torch tensors once (optionally in pinned / shared memory), and
+      each batch will be gathered from them with a single `index_select`.
+    * if `num_buffers` > 0 as well, batches will be gathered into a ring of
+      `num_buffers` preallocated buffers, so a batch is only valid until
+      `num_buffers` more batches are generated. This is mainly useful together
+      with `pin_memory`, where batches are copied to the device right away.
+      `PrefetchLoader` will raise if `num_buffers` is smaller than the number of
+      batches it may keep alive (2, or `prefetch_depth` + 3 with
+      `background_prefetch`).
+    * if `device` is provided as well, the feature store will be placed on it,
+      and the indices of each epoch will be uploaded once, so batches will be
+      gathered on the device without any per-step transfer.
+
+    """
+
+    _x_store: Optional[torch.Tensor] = None
+    _y_store: Optional[torch.Tensor] = None
+    _device: Optional[Union[str, torch.device]] = None
+
+    def __init__(
+        self,
+        batch_size: int,
+        sampler: ImbalancedSampler,
+        *,
+        return_indices: bool = False,
+        label_collator: Optional[Callable[[np.ndarray], np.ndarray]] = None,
+        verbose_level: int = 2,
+        use_feature_store: bool = False,
+        pin_memory: bool = False,
+        share_memory: bool = False,
+        num_buffers: int = 0,
+        device: Optional[Union[str, torch.device]] = None,
+    ):
+        super().__init__(
+            batch_size,
+            sampler,
+            return_indices=return_indices,
+            label_collator=label_collator,
+            verbose_level=verbose_level,
+        )
+        self.num_buffers = num_buffers
+        self._buffers: List[Tuple[torch.Tensor, Optional[torch.Tensor]]] = []
+        self._buffer_cursor = 0
+        if use_feature_store and label_collator is None:
+            self._init_feature_store(pin_memory, share_memory, device)
+
+    def _init_feature_store(
+        self,
+        pin_memory: bool,
+        share_memory: bool,
+        device: Optional[Union[str, torch.device]],
+    ) -> None:
+        processed = self.data.processed
+        if processed is None:
+            raise ValueError("`processed` is not provided")
+        x, y = processed.xy
+        x_store = to_torch(np.ascontiguousarray(x, np_float_type))
+        y_store = None
+        if y is not None:
+            y_store = to_torch(np.ascontiguousarray(y))
+            if self.data.is_clf:
+                y_store = y_store.to(torch.long)
+        self._device = device
+        on_device = device is not None
+        self._pin_memory = pin_memory and not on_device and torch.cuda.is_available()
+        stores = [x_store, y_store]
+        for i, store in enumerate(stores):
+            if store is None:
+                continue
+            if on_device:
+                store = store.to(device)
+            else:
+                if share_memory:
+                    store = store.share_memory_()
+                if self._pin_memory:
+                    store = store.pin_memory()
+            stores[i] = store
+        self._x_store, self._y_store = stores
+
+    def _new_buffer(self) -> Tuple[torch.Tensor, Optional[torch.Tensor]]:
+        assert self._x_store is not None
+        buffers = []
+        for store in [self._x_store, self._y_store]:
+            if store is None:
+                buffers.append(None)
+                continue
+            shape = self.batch_size, *store.shape[1:]
+            buffer = torch.empty(shape, dtype=store.dtype, device=store.device)
+            if self._pin_memory:
+                buffer = buffer.pin_memory()
+            buffers.append(buffer)
+        return buffers[0], buffers[1]
+
+    def _gather(self, indices: Union[np.ndarray, torch.Tensor]) -> tensor_dict_type:
+        assert self._x_store is not None
+        if isinstance(indices, torch.Tensor):
+            indices_tensor = indices
+        else:
+            indices_tensor = torch.from_numpy(indices).to(torch.long)
+        if self.num_buffers <= 0:
+            x_batch = self._x_store.index_select(0, indices_tensor)
+            labels = None
+            if self._y_store is not None:
+                labels = self._y_store.index_select(0, indices_tensor)
+        else:
+            if len(self._buffers) < self.num_buffers:
+                self._buffers.append(self._new_buffer())
+            x_buffer, y_buffer = self._buffers[self._buffer_cursor]
+            self._buffer_cursor = (self._buffer_cursor + 1) % self.num_buffers
+            num = len(indices)
+            x_batch = x_buffer[:num]
+            torch.index_select(self._x_store, 0, indices_tensor, out=x_batch)
+            labels = None
+            if self._y_store is not None:
+                assert y_buffer is not None
+                labels = y_buffer[:num]
+                torch.index_select(self._y_store, 0, indices_tensor, out=labels)
+        return {"x_batch": x_batch, self.labels_key: labels}
+
+    def _next_from_store(self) -> loader_batch_type:
+        n_iter, self._cursor = len(self), self._cursor + 1
+        if self._cursor == n_iter:
+            raise StopIteration
+        if self._indices_in_use is None:
+            raise ValueError("`_indices_in_use` is not yet generated")
+        start = self._cursor * self.batch_size
+        indices = self._indices_in_use[start : start + self.batch_size]
+        sample = self._gather(indices)
+        if not self.return_indices:
+            return sample
+        return sample, indices
+
+    @property
+    def use_feature_store(self) -> bool:
+        return self._x_store is not None and not self.is_onnx
+
+    @property
+    def is_device_resident(self) -> bool:
+        return self._x_store is not None and self._device is not None
+
+    def _reset(self) -> None:
+        # length of distributed samplers depends on whether they are shuffled
+        self._num_samples = len(self.sampler)
+        super()._reset()
+        if self.is_device_resident and not self.is_onnx:
+            assert self._x_store is not None
+            indices = torch.from_numpy(np.asarray(self._indices_in_use))
+            self._indices_in_use = indices.to(self._x_store.device, torch.long)
+
     def __next__(self) -> loader_batch_type:
+        if self.use_feature_store:
+            return self._next_from_store()
         sample = DataLoader.__next__(self)
         if self.return_indices:
             (x_batch, labels), indices = sample
@@ -58,6 +741,8 @@ class TabularLoader(DataLoader, DataLoaderProtocol):
 
     def copy(self) -> "DataLoader":
         copied_tabular_loader = copy.copy(self)
+        copied_tabular_loader._buffers = []
+        copied_tabular_loader._buffer_cursor = 0
         copied_loader = super().copy()
         shallow_copied = shallow_copy_dict(copied_loader.__dict__)
         update_dict(shallow_copied, copied_tabular_loader.__dict__)
@@ -67,5 +752,6 @@ class TabularLoader(DataLoader, DataLoaderProtocol):
 __all__ = [
     "TabularData",
     "TabularSampler",
+    "TabularDDPSampler",
     "TabularLoader",
 ]
@@ -0,0 +1,373 @@
+import os
+import copy
+import tempfile
+
+import numpy as np
+
+from typing import *
+from itertools import islice
+from cfdata.tabular import DataTuple
+
+from .core import TabularData
+from .core import TabularLoader
+from ..types import data_type
+from ..protocol import DataSplit
+from ..protocol import DataProtocol
+from ..protocol import SamplerProtocol
+from ..protocol import DataLoaderProtocol
+
+
+class DataChunk(NamedTuple):
+    x: np.ndarray
+    y: Optional[np.ndarray]
+    indices: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.x)
+
+    def take(self, indices: np.ndarray) -> "DataChunk":
+        y = None if self.y is None else self.y[indices]
+        return DataChunk(self.x[indices], y, self.indices[indices])
+
+    @classmethod
+    def concat(cls, chunks: List["DataChunk"]) -> "DataChunk":
+        if len(chunks) == 1:
+            return chunks[0]
+        x = np.vstack([chunk.x for chunk in chunks])
+        if chunks[0].y is None:
+            y = None
+        else:
+            y = np.vstack([chunk.y for chunk in chunks])
+        indices = np.hstack([chunk.indices for chunk in chunks])
+        return DataChunk(x, y, indices)
+
+
+@DataProtocol.register("tabular_stream")
+class TabularStreamData(TabularData):
+    """
+    `TabularData` which only keeps a sample of the given file in memory.
+
+    * recognizers, converters & processors are fitted on `num_fit_samples` rows
+      which are sampled after a first (counting) pass over the file.
+    * `iter_chunks` reads the file in chunks of `chunk_size` rows and transforms
+      each chunk with the fitted data structures.
+    * `.npy` files should hold features & labels together, with labels placed
+      at the last column.
+
+    """
+
+    def __init__(
+        self,
+        *,
+        num_fit_samples: int = 100000,
+        chunk_size: int = 100000,
+        **kwargs: Any,
+    ):
+        super().__init__(**kwargs)
+        self.num_fit_samples = num_fit_samples
+        self.chunk_size = chunk_size
+        self._stream_file: Optional[str] = None
+        self._stream_header: Optional[str] = None
+        self._stream_num_rows = 0
+        self._stream_fit_rows = np.zeros(0, np.int64)
+        self._stream_excluded = np.zeros(0, np.int64)
+
+    def __len__(self) -> int:
+        if not self.is_stream:
+            return super().__len__()
+        return self._stream_num_rows - len(self._stream_excluded)
+
+    @property
+    def is_stream(self) -> bool:
+        return self._stream_file is not None
+
+    @property
+    def is_npy(self) -> bool:
+        if self._stream_file is None:
+            return False
+        return os.path.splitext(self._stream_file)[1] == ".npy"
+
+    def _sample_rows(self, num_rows: int, offset: int = 0) -> np.ndarray:
+        if num_rows <= self.num_fit_samples:
+            return np.arange(offset, offset + num_rows)
+        rows = np.random.randint(0, num_rows, self.num_fit_samples)
+        return np.unique(rows) + offset
+
+    def _read_stream_npy(self, file_path: str) -> "TabularStreamData":
+        array = np.load(file_path, mmap_mode="r")
+        self._stream_num_rows = len(array)
+        rows = self._sample_rows(self._stream_num_rows)
+        sampled = np.asarray(array[rows])
+        super().read(sampled[..., :-1], sampled[..., -1:])
+        self._stream_fit_rows = rows
+        return self
+
+    def _read_stream_file(self, file_path: str) -> "TabularStreamData":
+        with open(file_path, "r") as f:
+            first_line = f.readline()
+            num_lines = 1 + sum(1 for _ in f)
+        # the first line is always kept because it may be the header
+        rows = self._sample_rows(num_lines - 1, 1)
+        with tempfile.TemporaryDirectory() as temp_folder:
+            ext = os.path.splitext(file_path)[1]
+            sample_path = os.path.join(temp_folder, f"sample{ext}")
+            with open(file_path, "r") as f, open(sample_path, "w") as g:
+                g.write(first_line)
+                cursor = 1
+                for row in rows:
+                    g.write(next(islice(f, row - cursor, None)))
+                    cursor = row + 1
+            super().read(sample_path)
+        assert self._raw is not None and self._raw.x is not None
+        if len(self._raw.x) == len(rows):
+            self._stream_header = first_line
+            self._stream_num_rows = num_lines - 1
+        else:
+            self._stream_header = None
+            self._stream_num_rows = num_lines
+            rows = np.hstack([[0], rows])
+        self._stream_fit_rows = rows
+        return self
+
+    def _transform_npy_chunk(self, array: np.ndarray) -> DataTuple:
+        return self.transform(array[..., :-1], array[..., -1:])
+
+    def _transform_file_chunk(self, lines: List[str]) -> DataTuple:
+        if self._stream_header is not None:
+            lines = [self._stream_header] + lines
+        return self.transform("".join(lines))
+
+    def _iter_npy_chunks(self) -> Iterator[DataChunk]:
+        assert self._stream_file is not None
+        array = np.load(self._stream_file, mmap_mode="r")
+        for start in range(0, self._stream_num_rows, self.chunk_size):
+            indices = np.arange(start, min(start + self.chunk_size, len(array)))
+            mask = ~np.isin(indices, self._stream_excluded)
+            indices = indices[mask]
+            if len(indices) == 0:
+                continue
+            chunk = np.asarray(array[start : start + len(mask)][mask])
+            processed = self._transform_npy_chunk(chunk)
+            yield DataChunk(processed.x, processed.y, indices)
+
+    def _iter_file_chunks(self) -> Iterator[DataChunk]:
+        assert self._stream_file is not None
+        excluded = set(self._stream_excluded.tolist())
+        offset = 0 if self._stream_header is None else 1
+        with open(self._stream_file, "r") as f:
+            if self._stream_header is not None:
+                f.readline()
+            row = offset
+            while True:
+                lines = list(islice(f, self.chunk_size))
+                if not lines:
+                    break
+                rows = np.arange(row, row + len(lines))
+                row += len(lines)
+                if excluded:
+                    mask = [i not in excluded for i in rows.tolist()]
+                    rows = rows[mask]
+                    lines = [line for line, keep in zip(lines, mask) if keep]
+                if not lines:
+                    continue
+                processed = self._transform_file_chunk(lines)
+                yield DataChunk(processed.x, processed.y, rows - offset)
+
+    def iter_chunks(self) -> Iterator[DataChunk]:
+        if not self.is_stream:
+            processed = self.processed
+            if processed is None:
+                raise ValueError("`processed` is not provided")
+            x, y = processed.xy
+            for start in range(0, len(x), self.chunk_size):
+                end = start + self.chunk_size
+                y_chunk = None if y is None else y[start:end]
+                indices = np.arange(start, min(end, len(x)))
+                yield DataChunk(x[start:end], y_chunk, indices)
+            return None
+        if self.is_npy:
+            yield from self._iter_npy_chunks()
+        else:
+            yield from self._iter_file_chunks()
+
+    def read(
+        self,
+        x: Union[str, data_type],
+        y: Optional[Union[int, data_type]] = None,
+        *,
+        contains_labels: bool = True,
+        **kwargs: Any,
+    ) -> "TabularStreamData":
+        if not isinstance(x, str):
+            super().read(x, y, contains_labels=contains_labels, **kwargs)
+            return self
+        if y is not None:
+            raise ValueError("`y` should not provided when `x` is a file.")
+        file_path = os.path.abspath(x)
+        if os.path.splitext(file_path)[1] == ".npy":
+            self._read_stream_npy(file_path)
+        else:
+            self._read_stream_file(file_path)
+        self._stream_file = file_path
+        return self
+
+    def split_with_indices(
+        self,
+        split_indices: np.ndarray,
+        remained_indices: np.ndarray,
+    ) -> DataSplit:
+        if not self.is_stream:
+            return super().split_with_indices(split_indices, remained_indices)
+        # indices are defined on the in-memory sample, so the split part is held
+        # in memory and its rows are excluded from the remained stream
+        sample = copy.copy(self)
+        sample._stream_file = None
+        split = TabularData.split_with_indices(sample, split_indices, remained_indices)
+        p1, p2 = split.split, split.remained
+        assert isinstance(p1, TabularStreamData)
+        assert isinstance(p2, TabularStreamData)
+        split_rows = self._stream_fit_rows[split_indices]
+        p1._stream_fit_rows = split_rows
+        p2._stream_file = self._stream_file
+        p2._stream_fit_rows = self._stream_fit_rows[remained_indices]
+        p2._stream_excluded = np.union1d(self._stream_excluded, split_rows)
+        return split
+
+    def copy_to(
+        self,
+        x: Union[str, data_type],
+        y: data_type = None,
+        *,
+        contains_labels: bool = True,
+    ) -> "TabularStreamData":
+        copied = super().copy_to(x, y, contains_labels=contains_labels)
+        assert isinstance(copied, TabularStreamData)
+        copied._stream_file = None
+        copied._stream_excluded = np.zeros(0, np.int64)
+        return copied
+
+
+@SamplerProtocol.register("tabular_stream")
+class TabularStreamSampler(SamplerProtocol):
+    def __init__(
+        self,
+        data: TabularStreamData,
+        *,
+        shuffle: bool = True,
+        buffer_size: int = 100000,
+        sample_weights: Optional[np.ndarray] = None,
+        verbose_level: int = 2,
+        **kwargs: Any,
+    ):
+        if sample_weights is not None:
+            raise ValueError("`sample_weights` is not supported in stream sampler")
+        self.data = data
+        self.shuffle = shuffle
+        self.buffer_size = buffer_size
+        self._verbose_level = verbose_level
+        self._sample_imbalance_flag = True
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    @property
+    def sample_imbalance(self) -> bool:
+        return self._sample_imbalance_flag
+
+    def switch_imbalance_status(self, flag: bool) -> None:
+        self._sample_imbalance_flag = flag
+
+    def get_chunks(self) -> Iterator[DataChunk]:
+        if not self.shuffle:
+            yield from self.data.iter_chunks()
+            return None
+        # bounded shuffle buffer : at most `buffer_size` rows are kept after
+        # each chunk arrives, the rest are emitted in a random order
+        buffer: Optional[DataChunk] = None
+        for chunk in self.data.iter_chunks():
+            if buffer is not None:
+                chunk = DataChunk.concat([buffer, chunk])
+            indices = np.random.permutation(len(chunk))
+            num_emit = max(0, len(chunk) - self.buffer_size)
+            if num_emit > 0:
+                yield chunk.take(indices[:num_emit])
+            buffer = chunk.take(indices[num_emit:])
+        if buffer is not None and len(buffer) > 0:
+            yield buffer
+
+    def copy(self) -> "TabularStreamSampler":
+        return TabularStreamSampler(
+            self.data,
+            shuffle=self.shuffle,
+            buffer_size=self.buffer_size,
+            verbose_level=self._verbose_level,
+        )
+
+
+@DataLoaderProtocol.register("tabular_stream")
+class TabularStreamLoader(TabularLoader):
+    def __init__(
+        self,
+        batch_size: int,
+        sampler: TabularStreamSampler,
+        *,
+        return_indices: bool = False,
+        label_collator: Optional[Callable[[np.ndarray], np.ndarray]] = None,
+        verbose_level: int = 2,
+        **kwargs: Any,
+    ):
+        self.data = sampler.data
+        self.sampler = sampler
+        # stream indices could not be used to access in-memory caches
+        self.return_indices = return_indices and not self.data.is_stream
+        self._label_collator = label_collator
+        self._verbose_level = verbose_level
+        self._num_siamese = 1
+        self._num_samples = len(sampler)
+        self.batch_size = min(self._num_samples, batch_size)
+        self._batches: Optional[Iterator[Any]] = None
+
+    def _iter_batches(self) -> Iterator[Any]:
+        pending: List[DataChunk] = []
+        num_pending = 0
+        for chunk in self.sampler.get_chunks():
+            pending.append(chunk)
+            num_pending += len(chunk)
+            if num_pending < self.batch_size:
+                continue
+            merged = DataChunk.concat(pending)
+            num_batches = num_pending // self.batch_size
+            for i in range(num_batches):
+                start = i * self.batch_size
+                yield merged.take(np.arange(start, start + self.batch_size))
+            start = num_batches * self.batch_size
+            pending = [merged.take(np.arange(start, num_pending))]
+            num_pending -= start
+        if num_pending > 0:
+            yield DataChunk.concat(pending)
+
+    def _reset(self) -> None:
+        self._batches = self._iter_batches()
+
+    def _get_next_batch(self) -> Any:
+        if self._batches is None:
+            raise ValueError("`_batches` is not yet generated")
+        chunk = next(self._batches)
+        batch = chunk.x, chunk.y
+        if not self.return_indices:
+            return batch
+        return batch, chunk.indices
+
+    def copy(self) -> "TabularStreamLoader":
+        copied = copy.copy(self)
+        copied.sampler = self.sampler.copy()
+        copied._batches = None
+        return copied
+
+
+__all__ = [
+    "DataChunk",
+    "TabularStreamData",
+    "TabularStreamSampler",
+    "TabularStreamLoader",
+]
@@ -46,8 +46,10 @@ class PreProcessor(LoggingMixinWithRank):
         data: DataProtocol,
         shuffle: bool,
         sample_weights: Optional[np.ndarray] = None,
+        **kwargs: Any,
     ) -> SamplerProtocol:
         config = shallow_copy_dict(self.sampler_config)
+        config.update(kwargs)
         config["shuffle"] = shuffle
         config["sample_weights"] = sample_weights
         return SamplerProtocol.make(self.sampler_protocol, data, **config)
@@ -77,6 +79,7 @@ class PreProcessor(LoggingMixinWithRank):
         save_data: bool = True,
         retain_data: bool = False,
         remove_original: bool = True,
+        mmap_data: bool = False,
     ) -> "PreProcessor":
         abs_folder = os.path.abspath(export_folder)
         base_folder = os.path.dirname(abs_folder)
@@ -88,6 +91,7 @@ class PreProcessor(LoggingMixinWithRank):
                     data_folder,
                     retain_data=retain_data,
                     compress=False,
+                    mmap=mmap_data,
                 )
             with open(os.path.join(export_folder, self.protocols_file), "w") as f:
                 json.dump(
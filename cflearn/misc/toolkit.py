@@ -1,5 +1,8 @@
 import os
+import dill
+import json
 import math
+import hashlib
 import torch
 import inspect
 import logging
@@ -63,6 +66,26 @@ def to_2d(arr: data_type) -> data_type:
     return [[elem] for elem in arr]  # type: ignore
 
 
+def hash_data(*items: Any) -> str:
+    """content based hash of data (arrays, files or lists) & json-able configs"""
+    md5 = hashlib.md5()
+    for item in items:
+        if item is None:
+            md5.update(b"none")
+        elif isinstance(item, str) and os.path.isfile(item):
+            with open(item, "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    md5.update(block)
+        elif isinstance(item, np.ndarray) and item.dtype != object:
+            md5.update(f"{item.dtype}{item.shape}".encode())
+            md5.update(np.ascontiguousarray(item).tobytes())
+        elif isinstance(item, dict):
+            md5.update(json.dumps(item, sort_keys=True, default=str).encode())
+        else:
+            md5.update(dill.dumps(item))
+    return md5.hexdigest()
+
+
 def to_prob(raw: np.ndarray) -> np.ndarray:
     return F.softmax(torch.from_numpy(raw), dim=1).numpy()
 
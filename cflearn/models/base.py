@@ -1,9 +1,12 @@
+import os
 import torch
 
 import numpy as np
 
 from typing import *
 from abc import ABCMeta
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from torch import Tensor
 from torch.nn import Module
 from torch.nn import ModuleDict
@@ -28,9 +31,14 @@ from ..protocol import TrainerState
 from ..protocol import ModelProtocol
 from ..protocol import DataLoaderProtocol
 from ..misc.toolkit import to_torch
+from ..misc.toolkit import to_numpy
+from ..misc.toolkit import eval_context
+from ..misc.toolkit import switch_requires_grad
 from ..modules.heads import HeadBase
 from ..modules.heads import HeadConfigs
+from ..modules.heads.linear import LinearHead
 from ..modules.blocks import DNDF
+from ..modules.blocks import GroupedLinear
 from ..modules.transform import transform_config_mapping
 from ..modules.transform import Transform
 from ..modules.transform import Dimensions
@@ -221,6 +229,13 @@ class ModelBase(ModelProtocol, metaclass=ABCMeta):
         # caches
         self._transform_cache: Dict[str, Tensor] = {}
         self._extractor_cache: Dict[str, Tensor] = {}
+        # independent extractors & heads will be executed concurrently
+        self.parallel_pipes = self.config.setdefault("parallel_pipes", False)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        # identical heads will be executed in groups
+        self._init_head_groups()
+        # frozen extractors
+        self._init_frozen_features()
 
     def __getattr__(self, item: str) -> Any:
         try:
@@ -413,8 +428,12 @@ class ModelBase(ModelProtocol, metaclass=ABCMeta):
         **kwargs: Any,
     ) -> tensor_dict_type:
         x_batch = batch["x_batch"]
-        split = self._split_features(x_batch, batch_indices, loader_name)
-        outputs = self.execute(split)
+        if self._fetch_frozen_features(batch_indices, loader_name):
+            # every extractor is cached, so `x_batch` will not be used
+            outputs = self.execute(x_batch)
+        else:
+            split = self._split_features(x_batch, batch_indices, loader_name)
+            outputs = self.execute(split)
         # check whether outputs from each pipe are of identical type
         return_type = None
         for pipe_outputs in outputs.values():
@@ -519,6 +538,105 @@ class ModelBase(ModelProtocol, metaclass=ABCMeta):
     ) -> Union[Tensor, tensor_dict_type]:
         return head(extracted, **head_kwargs)
 
+    def _init_head_groups(self) -> None:
+        # pipes with structurally identical linear heads could be executed with
+        # one batched matmul, their parameters will be views of a stacked storage
+        self._head_groups: Dict[str, List[str]] = {}
+        self._head_group_storages: Dict[str, Tuple[Tensor, Optional[Tensor]]] = {}
+        if not self.config.setdefault("group_heads", False):
+            return
+        # grouped heads cannot go through an overridden `_head`
+        if type(self)._head is not ModelBase._head:
+            return
+        groups: Dict[Tuple[int, int, bool], List[str]] = defaultdict(list)
+        for key, head in self.heads.items():
+            if type(head) is not LinearHead or head.linear.pruner is not None:
+                continue
+            has_bias = head.linear.bias is not None
+            groups[(head.in_dim, head.out_dim, has_bias)].append(key)
+        for keys in groups.values():
+            if len(keys) > 1:
+                for key in keys:
+                    self._head_groups[key] = keys
+
+    def _head_group_params(self, keys: List[str]) -> List[Tensor]:
+        linears = [self.heads[key].linear for key in keys]
+        params = [linear.weight for linear in linears]
+        for linear in linears:
+            if linear.bias is not None:
+                params.append(linear.bias)
+        return params
+
+    @staticmethod
+    def _head_group_views(weight: Tensor, bias: Optional[Tensor]) -> List[Tensor]:
+        views = list(weight.unbind(0))
+        if bias is not None:
+            views.extend(bias.unbind(0))
+        return views
+
+    def _head_group_storage(
+        self,
+        keys: List[str],
+        params: List[Tensor],
+    ) -> Tuple[Tensor, Optional[Tensor]]:
+        storage = self._head_group_storages.get(keys[0])
+        if storage is not None:
+            views = self._head_group_views(*storage)
+            if all(p.data_ptr() == v.data_ptr() for p, v in zip(params, views)):
+                return storage
+        # moving (or copying) the model will re-allocate the parameters, so the
+        # storage should be (re)built and parameters should be pointed back
+        num_heads = len(keys)
+        with torch.no_grad():
+            weight = torch.stack(params[:num_heads])
+            bias = None if len(params) == num_heads else torch.stack(params[num_heads:])
+        for param, view in zip(params, self._head_group_views(weight, bias)):
+            param.data = view
+        self._head_group_storages[keys[0]] = weight, bias
+        return weight, bias
+
+    def _grouped_linear_heads(
+        self,
+        keys: List[str],
+        extracted_list: List[Tensor],
+    ) -> List[Tensor]:
+        params = self._head_group_params(keys)
+        weight, bias = self._head_group_storage(keys, params)
+        net = extracted_list[0]
+        if all(extracted is net for extracted in extracted_list):
+            outputs = GroupedLinear.apply(net, weight, bias, *params)
+            return list(outputs.split(weight.shape[1], dim=-1))
+        stacked = torch.stack(extracted_list)
+        outputs = GroupedLinear.apply(stacked, weight, bias, *params)
+        return list(outputs.unbind(0))
+
+    @staticmethod
+    def _has_hooks(module: Module) -> bool:
+        for m in module.modules():
+            if m._forward_pre_hooks or m._forward_hooks or m._backward_hooks:
+                return True
+        return False
+
+    def _execute_grouped_heads(self, grouped: Dict[str, Tensor]) -> Dict[str, Tensor]:
+        outputs: Dict[str, Tensor] = {}
+        for key, extracted in grouped.items():
+            if key in outputs:
+                continue
+            group = [k for k in self._head_groups[key] if k in grouped]
+            extracted_list = [grouped[k] for k in group]
+            # heads with hooks should be called as modules
+            if (
+                len(group) < len(self._head_groups[key])
+                or any(net.dim() != 2 for net in extracted_list)
+                or any(self._has_hooks(self.heads[k]) for k in group)
+            ):
+                for k, net in zip(group, extracted_list):
+                    outputs[k] = self._head(self.heads[k], net, {})
+                continue
+            group_outputs = self._grouped_linear_heads(group, extracted_list)
+            outputs.update(zip(group, group_outputs))
+        return outputs
+
     def execute(
         self,
         net: Union[Tensor, SplitFeatures],
@@ -526,21 +644,36 @@ class ModelBase(ModelProtocol, metaclass=ABCMeta):
         clear_cache: bool = True,
         extract_kwargs_dict: Optional[Dict[str, Dict[str, Any]]] = None,
         head_kwargs_dict: Optional[Dict[str, Dict[str, Any]]] = None,
+    ) -> tensor_dict_type:
+        if extract_kwargs_dict is None:
+            extract_kwargs_dict = {}
+        if head_kwargs_dict is None:
+            head_kwargs_dict = {}
+        if not self.parallel_pipes:
+            execute_fn = self._execute_sequentially
+        else:
+            execute_fn = self._execute_concurrently
+        results = execute_fn(net, extract_kwargs_dict, head_kwargs_dict)
+        if clear_cache:
+            self.clear_execute_cache()
+        return results
+
+    def _execute_sequentially(
+        self,
+        net: Union[Tensor, SplitFeatures],
+        extract_kwargs_dict: Dict[str, Dict[str, Any]],
+        head_kwargs_dict: Dict[str, Dict[str, Any]],
     ) -> tensor_dict_type:
         results: Dict[str, Union[Tensor, tensor_dict_type]] = {}
+        grouped: Dict[str, Tensor] = {}
         for key, (transform_key, extractor_key, _) in self.pipes.items():
             if key in self.bypassed_pipes:
                 continue
-            # transform
-            transformed = self._transform_cache.get(transform_key)
-            if transformed is None:
-                transformed = self._transform(self.transforms[transform_key], net)
-                self._transform_cache[transform_key] = transformed
-            # extract
-            if extract_kwargs_dict is None:
-                extract_kwargs_dict = {}
             extracted = self._extractor_cache.get(extractor_key)
             if extracted is None:
+                # transform
+                transformed = self._get_transformed(net, transform_key)
+                # extract
                 extract_kwargs = extract_kwargs_dict.get(extractor_key, {})
                 extracted = self._extract(
                     self.extractors[extractor_key],
@@ -548,43 +681,253 @@ class ModelBase(ModelProtocol, metaclass=ABCMeta):
                     extract_kwargs,
                 )
                 self._extractor_cache[extractor_key] = extracted
-            if head_kwargs_dict is None:
-                head_kwargs_dict = {}
             head_kwargs = head_kwargs_dict.get(key, {})
+            if key in self._head_groups and not head_kwargs:
+                grouped[key] = extracted
+                continue
             results[key] = self._head(self.heads[key], extracted, head_kwargs)
-        if clear_cache:
-            self.clear_execute_cache()
-        return results
+        if not grouped:
+            return results
+        results.update(self._execute_grouped_heads(grouped))
+        return {k: results[k] for k in self.pipes if k in results}
+
+    def _get_transformed(
+        self,
+        net: Union[Tensor, SplitFeatures],
+        transform_key: str,
+    ) -> Tensor:
+        transformed = self._transform_cache.get(transform_key)
+        if transformed is None:
+            transformed = self._transform(self.transforms[transform_key], net)
+            self._transform_cache[transform_key] = transformed
+        return transformed
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        # one executor is shared across steps, so threads are only created once
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max(1, len(self.pipes)))
+        return self._executor
+
+    def shutdown_executor(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # executors cannot be pickled or copied, they will be created lazily
+        state = self.__dict__.copy()
+        state["_executor"] = None
+        # stacked storages of head groups will also be rebuilt lazily
+        state["_head_group_storages"] = {}
+        return state
+
+    def __del__(self) -> None:
+        executor = self.__dict__.get("_executor")
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+    def _run_concurrently(
+        self,
+        fn: Callable[[str], Any],
+        keys: List[str],
+    ) -> Dict[str, Any]:
+        if len(keys) <= 1:
+            return {key: fn(key) for key in keys}
+        # grad mode & autocast states are thread local
+        grad_enabled = torch.is_grad_enabled()
+        autocast_enabled = amp is not None and torch.is_autocast_enabled()
+
+        def _fn(key: str) -> Any:
+            with torch.set_grad_enabled(grad_enabled):
+                if not autocast_enabled:
+                    return fn(key)
+                with amp.autocast():  # type: ignore
+                    return fn(key)
+
+        executor = self._get_executor()
+        futures = {key: executor.submit(_fn, key) for key in keys}
+        return {key: future.result() for key, future in futures.items()}
+
+    def _execute_concurrently(
+        self,
+        net: Union[Tensor, SplitFeatures],
+        extract_kwargs_dict: Dict[str, Dict[str, Any]],
+        head_kwargs_dict: Dict[str, Dict[str, Any]],
+    ) -> tensor_dict_type:
+        pipes = {k: v for k, v in self.pipes.items() if k not in self.bypassed_pipes}
+        # transforms are light weight and shared, so they are executed in order
+        transformed_dict: Dict[str, Tensor] = {}
+        for transform_key, extractor_key, _ in pipes.values():
+            if extractor_key in self._extractor_cache:
+                continue
+            transformed_dict[extractor_key] = self._get_transformed(net, transform_key)
+
+        def extract_fn(extractor_key: str) -> Tensor:
+            return self._extract(
+                self.extractors[extractor_key],
+                transformed_dict[extractor_key],
+                extract_kwargs_dict.get(extractor_key, {}),
+            )
+
+        def head_fn(key: str) -> Union[Tensor, tensor_dict_type]:
+            extracted = self._extractor_cache[pipes[key][1]]
+            return self._head(self.heads[key], extracted, head_kwargs_dict.get(key, {}))
+
+        extractor_keys = list(transformed_dict)
+        self._extractor_cache.update(self._run_concurrently(extract_fn, extractor_keys))
+        grouped = {
+            key: self._extractor_cache[extractor_key]
+            for key, (_, extractor_key, _) in pipes.items()
+            if key in self._head_groups and not head_kwargs_dict.get(key)
+        }
+        keys = [key for key in pipes if key not in grouped]
+        results = self._run_concurrently(head_fn, keys)
+        if not grouped:
+            return results
+        results.update(self._execute_grouped_heads(grouped))
+        return {key: results[key] for key in pipes}
 
     def clear_execute_cache(self) -> None:
         self._transform_cache = {}
         self._extractor_cache = {}
 
+    def _init_frozen_features(self) -> None:
+        # if extractors are frozen, their outputs will be computed once per
+        # loader and only the heads will be trained afterwards
+        self.freeze_extractors = self.config.setdefault("freeze_extractors", False)
+        self.feature_cache_folder = self.config.setdefault("feature_cache_folder", None)
+        self._feature_caches: Dict[str, Dict[str, Union[Tensor, np.ndarray]]] = {}
+        self._feature_loaders: Dict[str, DataLoaderProtocol] = {}
+        if not self.freeze_extractors:
+            return
+        for module in [self.encoder, self.transforms, self.extractors]:
+            if module is not None:
+                switch_requires_grad(list(module.parameters()), False)
+        # features can only be cached when each sample is a single row
+        if self.num_history > 1:
+            return
+        loaders = {"tr": self.tr_loader, "cv": self.cv_loader}
+        for name, loader in loaders.items():
+            if loader is not None and loader.return_indices:
+                self._feature_loaders[name] = loader
+
+    def _compile_frozen_features(self, name: str) -> Dict[str, Any]:
+        loader = self._feature_loaders[name]
+        x = loader.data.processed.x
+        chunk_size = loader.batch_size
+        caches: Dict[str, Any] = {}
+        chunks: Dict[str, List[Tensor]] = defaultdict(list)
+        with eval_context(self):
+            for start in range(0, len(x), chunk_size):
+                end = min(start + chunk_size, len(x))
+                x_batch = to_torch(x[start:end]).to(self.device)
+                split = self._split_features(x_batch, None, None)
+                for key, (transform_key, extractor_key, _) in self.pipes.items():
+                    if key in self.bypassed_pipes:
+                        continue
+                    if extractor_key in self._extractor_cache:
+                        continue
+                    transformed = self._get_transformed(split, transform_key)
+                    extractor = self.extractors[extractor_key]
+                    extracted = self._extract(extractor, transformed, {})
+                    self._extractor_cache[extractor_key] = extracted
+                for extractor_key, extracted in self._extractor_cache.items():
+                    if self.feature_cache_folder is None:
+                        chunks[extractor_key].append(extracted)
+                        continue
+                    cache = caches.get(extractor_key)
+                    if cache is None:
+                        os.makedirs(self.feature_cache_folder, exist_ok=True)
+                        file = f"{name}_{extractor_key}.npy"
+                        path = os.path.join(self.feature_cache_folder, file)
+                        cache = caches[extractor_key] = np.lib.format.open_memmap(
+                            path,
+                            mode="w+",
+                            dtype=np.float32,
+                            shape=(len(x), *extracted.shape[1:]),
+                        )
+                    cache[start:end] = to_numpy(extracted)
+                self.clear_execute_cache()
+        for extractor_key, extracted_chunks in chunks.items():
+            caches[extractor_key] = torch.cat(extracted_chunks)
+        self._feature_caches[name] = caches
+        return caches
+
+    def _fetch_frozen_features(
+        self,
+        batch_indices: Optional[Union[np.ndarray, Tensor]],
+        loader_name: Optional[str],
+    ) -> bool:
+        if batch_indices is None or loader_name is None:
+            return False
+        if torch.jit.is_tracing():
+            return False
+        caches = self._feature_caches.get(loader_name)
+        if caches is None:
+            if loader_name not in self._feature_loaders:
+                return False
+            caches = self._compile_frozen_features(loader_name)
+        for extractor_key, cache in caches.items():
+            if isinstance(cache, Tensor):
+                if not isinstance(batch_indices, Tensor):
+                    batch_indices = to_torch(batch_indices)
+                features = cache[batch_indices.to(cache.device)]
+            else:
+                if isinstance(batch_indices, Tensor):
+                    batch_indices = to_numpy(batch_indices)
+                features = to_torch(cache[batch_indices]).to(self.device)
+            self._extractor_cache[extractor_key] = features
+        return True
+
+    def _load_from_state_dict(
+        self,
+        state_dict: Dict[str, Any],
+        prefix: str,
+        local_metadata: Dict[str, Any],
+        *args: Any,
+        **kwargs: Any,
+    ) -> None:
+        # cached features are outdated once new states are loaded
+        self._feature_caches = {}
+        super()._load_from_state_dict(
+            state_dict,
+            prefix,
+            local_metadata,
+            *args,
+            **kwargs,
+        )
+
     def get_split(self, processed: np.ndarray, device: torch.device) -> SplitFeatures:
         with torch.no_grad():
             return self._split_features(to_torch(processed).to(device), None, None)
 
-    def export_context(self) -> context_error_handler:
+    def export_context(
+        self,
+        *,
+        dndf_top_k: Optional[int] = None,
+    ) -> context_error_handler:
         class _(context_error_handler):
             def __init__(self, model: ModelBase):
-                self.fast_dndf_settings: Dict[DNDF, bool] = {}
+                self.dndf_top_k_settings: Dict[DNDF, Optional[int]] = {}
 
                 def _inject(node: Module) -> None:
                     for child in node.children():
                         if isinstance(child, DNDF):
-                            self.fast_dndf_settings[child] = child._fast
+                            top_k = child._inference_top_k
+                            self.dndf_top_k_settings[child] = top_k
                         elif isinstance(child, Module):
                             _inject(child)
 
                 _inject(model)
 
             def __enter__(self) -> None:
-                for dndf in self.fast_dndf_settings:
-                    dndf._fast = False
+                if dndf_top_k is not None:
+                    for dndf in self.dndf_top_k_settings:
+                        dndf._inference_top_k = dndf_top_k
 
             def _normal_exit(self, exc_type: Any, exc_val: Any, exc_tb: Any) -> None:
-                for dndf, fast in self.fast_dndf_settings.items():
-                    dndf._fast = fast
+                for dndf, top_k in self.dndf_top_k_settings.items():
+                    dndf._inference_top_k = top_k
 
         return _(self)
 
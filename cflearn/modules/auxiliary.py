@@ -50,9 +50,13 @@ class EMA(nn.Module):
         self,
         decay: float,
         named_parameters: List[Tuple[str, nn.Parameter]],
+        *,
+        update_every: int = 1,
     ):
         super().__init__()
         self._decay = decay
+        self._update_every = update_every
+        self._num_steps = 0
         self._named_parameters = named_parameters
         for name, param in self.tgt_params:
             self.register_buffer(self.get_name(True, name), param.data.clone())
@@ -70,24 +74,51 @@ class EMA(nn.Module):
             self._named_parameters,
         )
 
+    def _get_tensors(self, train: bool) -> List[torch.Tensor]:
+        names = [self.get_name(train, name) for name, _ in self.tgt_params]
+        return [getattr(self, name) for name in names]
+
+    def _get_params(self) -> List[torch.Tensor]:
+        return [param.data for _, param in self.tgt_params]
+
+    @staticmethod
+    def _copy(targets: List[torch.Tensor], sources: List[torch.Tensor]) -> None:
+        for target, source in zip(targets, sources):
+            target.copy_(source)
+
+    @torch.no_grad()
     def forward(self) -> None:
-        for name, param in self.tgt_params:
-            setattr(self, self.get_name(True, name), param.data.clone())
-            ema_name = self.get_name(False, name)
-            ema_attr = getattr(self, ema_name)
-            ema = (1.0 - self._decay) * param.data + self._decay * ema_attr
-            setattr(self, ema_name, ema.clone())
+        self._num_steps += 1
+        if self._num_steps % self._update_every != 0:
+            return None
+        # ema = decay * ema + (1 - decay) * param, updated in place
+        ema_tensors = self._get_tensors(False)
+        params = self._get_params()
+        if hasattr(torch, "_foreach_mul_"):
+            torch._foreach_mul_(ema_tensors, self._decay)
+            torch._foreach_add_(ema_tensors, params, alpha=1.0 - self._decay)
+        else:
+            for ema, param in zip(ema_tensors, params):
+                ema.mul_(self._decay).add_(param, alpha=1.0 - self._decay)
 
+    @torch.no_grad()
     def train(self, mode: bool = True) -> "EMA":
+        # weights are only swapped on `train` <-> `eval` transitions, trained
+        # weights are stored when leaving `train` and restored when coming back
+        switched = self.training != mode
         super().train(mode)
-        for name, param in self.tgt_params:
-            param.data = getattr(self, self.get_name(mode, name)).clone()
+        if switched:
+            params = self._get_params()
+            if not mode:
+                self._copy(self._get_tensors(True), params)
+            self._copy(params, self._get_tensors(mode))
         return self
 
     def extra_repr(self) -> str:
         max_str_len = max(len(name) for name, _ in self.tgt_params)
         return "\n".join(
-            [f"(0): decay_rate={self._decay}\n(1): Params("]
+            [f"(0): decay_rate={self._decay}, update_every={self._update_every}"]
+            + ["(1): Params("]
             + [
                 f"  {name:<{max_str_len}s} - torch.Tensor({list(param.shape)})"
                 for name, param in self.tgt_params
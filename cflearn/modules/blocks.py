@@ -20,6 +20,7 @@ from typing import Optional
 from typing import NamedTuple
 from torch.nn import Module
 from torch.nn import ModuleList
+from torch.utils.checkpoint import checkpoint
 from cftool.misc import register_core
 from cftool.misc import shallow_copy_dict
 from cftool.misc import LoggingMixin
@@ -88,6 +89,49 @@ class Linear(Module):
             self.linear.bias.data.fill_(bias_fill)
 
 
+class GroupedLinear(torch.autograd.Function):
+    """
+    Executes a group of linear layers with one matmul. `weight` & `bias` are the
+    stacked storages, whose slices are the parameters of each layer. These
+    parameters are passed in as `params` so their gradients could be returned.
+
+    * `net` could either be a 2d tensor shared by all layers, or a 3d tensor
+    stacked from the input of each layer.
+    """
+
+    @staticmethod
+    def forward(ctx: Any, *args: Any, **kwargs: Any) -> Tensor:
+        net, weight, bias = args[:3]
+        ctx.save_for_backward(net, weight)
+        ctx.use_bias = bias is not None
+        if net.dim() == 2:
+            flat_weight = weight.view(-1, weight.shape[-1])
+            flat_bias = None if bias is None else bias.view(-1)
+            return F.linear(net, flat_weight, flat_bias)
+        if bias is None:
+            return torch.bmm(net, weight.transpose(1, 2))
+        return torch.baddbmm(bias.unsqueeze(1), net, weight.transpose(1, 2))
+
+    @staticmethod
+    def backward(ctx: Any, *grad_outputs: Any) -> Tuple[Optional[Tensor], ...]:
+        net, weight = ctx.saved_tensors
+        # outputs might be in half precision under autocast
+        grad_output = grad_outputs[0].to(weight.dtype)
+        local_net = net.to(weight.dtype)
+        if net.dim() == 2:
+            net_grad = grad_output.matmul(weight.view(-1, weight.shape[-1]))
+            weight_grad = grad_output.t().matmul(local_net).view_as(weight)
+            bias_grad = grad_output.sum(0).view(weight.shape[0], -1)
+        else:
+            net_grad = torch.bmm(grad_output, weight)
+            weight_grad = torch.bmm(grad_output.transpose(1, 2), local_net)
+            bias_grad = grad_output.sum(1)
+        param_grads = list(weight_grad.unbind(0))
+        if ctx.use_bias:
+            param_grads.extend(bias_grad.unbind(0))
+        return (net_grad.to(net.dtype), None, None, *param_grads)
+
+
 class MappingBase(Module):
     def __init__(self, *args: Any, **kwargs: Any):
         super().__init__()
@@ -484,18 +528,16 @@ class LeafAggregation(torch.autograd.Function):
 
 class Route(torch.autograd.Function):
     @staticmethod
-    def forward(ctx: Any, *args: Any, **kwargs: Any) -> Tensor:
-        (
-            net,
-            tree_arange,
-            batch_indices,
-            ones,
-            increment_masks,
-            num_tree,
-            num_batch,
-            tree_depth,
-            num_internals,
-        ) = args
+    def _routes(
+        net: Tensor,
+        tree_arange: Tensor,
+        batch_indices: Tensor,
+        increment_masks: Tensor,
+        num_tree: int,
+        num_batch: int,
+        tree_depth: int,
+        num_internals: int,
+    ) -> Tuple[Tensor, List[Tensor], Tensor]:
         shape = num_batch, -1, num_internals
         sigmoid_net = torch.sigmoid(net)
         p_left = sigmoid_net.view(*shape).transpose(0, 1)
@@ -513,20 +555,17 @@ class Route(torch.autograd.Function):
             current_routes = flat_probabilities.take(current_indices)
             all_routes.append(current_routes)
             routes *= current_routes
-        ctx.save_for_backward(ones, sigmoid_net, *all_routes)
-        ctx.tree_depth = tree_depth
-        ctx.num_tree = num_tree
-        return routes
+        return sigmoid_net, all_routes, routes
 
     @staticmethod
-    def backward(ctx: Any, *grad_outputs: Any) -> Tuple[Optional[Tensor], ...]:
-        grad_output = grad_outputs[0]
-        dummy_grads = tuple(None for _ in range(8))
-        if grad_output is None:
-            return (None,) + dummy_grads
-        num_tree = ctx.num_tree
-        tree_depth = ctx.tree_depth
-        ones_list, sigmoid_net, *all_routes = ctx.saved_tensors
+    def _backward(
+        grad_output: Tensor,
+        ones_list: Tensor,
+        sigmoid_net: Tensor,
+        all_routes: List[Tensor],
+        num_tree: int,
+        tree_depth: int,
+    ) -> Tensor:
         cursor = 0
         divide = 1
         num_leaves = 2 ** (tree_depth + 1)
@@ -549,7 +588,117 @@ class Route(torch.autograd.Function):
 
         sub_grads = sub_grads.transpose(0, 1).contiguous()
         sub_grads = sub_grads.view(-1, num_tree * (num_leaves - 1))
-        return (sigmoid_net * (1.0 - sigmoid_net) * sub_grads,) + dummy_grads
+        return sigmoid_net * (1.0 - sigmoid_net) * sub_grads
+
+    @staticmethod
+    def forward(ctx: Any, *args: Any, **kwargs: Any) -> Tensor:
+        (
+            net,
+            tree_arange,
+            batch_indices,
+            ones,
+            increment_masks,
+            num_tree,
+            num_batch,
+            tree_depth,
+            num_internals,
+        ) = args
+        sigmoid_net, all_routes, routes = Route._routes(
+            net,
+            tree_arange,
+            batch_indices,
+            increment_masks,
+            num_tree,
+            num_batch,
+            tree_depth,
+            num_internals,
+        )
+        ctx.save_for_backward(ones, sigmoid_net, *all_routes)
+        ctx.tree_depth = tree_depth
+        ctx.num_tree = num_tree
+        return routes
+
+    @staticmethod
+    def backward(ctx: Any, *grad_outputs: Any) -> Tuple[Optional[Tensor], ...]:
+        grad_output = grad_outputs[0]
+        dummy_grads = tuple(None for _ in range(8))
+        if grad_output is None:
+            return (None,) + dummy_grads
+        ones_list, sigmoid_net, *all_routes = ctx.saved_tensors
+        net_grad = Route._backward(
+            grad_output,
+            ones_list,
+            sigmoid_net,
+            all_routes,
+            ctx.num_tree,
+            ctx.tree_depth,
+        )
+        return (net_grad,) + dummy_grads
+
+
+class RecomputedRoute(torch.autograd.Function):
+    """
+    Memory efficient version of `Route`. Only `net` is saved for backward, and
+    the routes of each level are recomputed when gradients are required, which
+    trades one extra routing pass for O(tree_depth) less activation memory.
+    """
+
+    @staticmethod
+    def forward(ctx: Any, *args: Any, **kwargs: Any) -> Tensor:
+        (
+            net,
+            tree_arange,
+            batch_indices,
+            ones,
+            increment_masks,
+            num_tree,
+            num_batch,
+            tree_depth,
+            num_internals,
+        ) = args
+        routes = Route._routes(
+            net,
+            tree_arange,
+            batch_indices,
+            increment_masks,
+            num_tree,
+            num_batch,
+            tree_depth,
+            num_internals,
+        )[-1]
+        ctx.save_for_backward(net, tree_arange, batch_indices, ones, increment_masks)
+        ctx.num_tree = num_tree
+        ctx.num_batch = num_batch
+        ctx.tree_depth = tree_depth
+        ctx.num_internals = num_internals
+        return routes
+
+    @staticmethod
+    def backward(ctx: Any, *grad_outputs: Any) -> Tuple[Optional[Tensor], ...]:
+        grad_output = grad_outputs[0]
+        dummy_grads = tuple(None for _ in range(8))
+        if grad_output is None:
+            return (None,) + dummy_grads
+        net, tree_arange, batch_indices, ones_list, increment_masks = ctx.saved_tensors
+        sigmoid_net, all_routes, _ = Route._routes(
+            net,
+            tree_arange,
+            batch_indices,
+            increment_masks,
+            ctx.num_tree,
+            ctx.num_batch,
+            ctx.tree_depth,
+            ctx.num_internals,
+        )
+        net_grad = Route._backward(
+            grad_output,
+            ones_list,
+            sigmoid_net,
+            all_routes,
+            ctx.num_tree,
+            ctx.tree_depth,
+        )
+        return (net_grad,) + dummy_grads
 
 
 class DNDF(Module):
@@ -563,6 +712,8 @@ class DNDF(Module):
         is_regression: Optional[bool] = None,
         tree_proj_config: Optional[Dict[str, Any]] = None,
         use_fast_dndf: bool = True,
+        recompute: bool = False,
+        inference_top_k: Optional[int] = None,
     ):
         super().__init__()
         self._num_tree = num_tree
@@ -574,6 +725,12 @@ class DNDF(Module):
         self._num_internals = self._num_leaf - 1
         self._output_dim = out_dim
         self._fast = use_fast_dndf
+        self._recompute = recompute
+        # sparse routing in eval mode: `1` follows the argmax path of each tree,
+        # which is O(tree_depth), while `k > 1` keeps the k most probable leaves
+        # of each tree (renormalized) and only gathers their rows. Smaller `k` is
+        # faster, but its predictions drift further from the soft routing ones
+        self._inference_top_k = inference_top_k
         if tree_proj_config is None:
             tree_proj_config = {}
         tree_proj_config.setdefault("pruner_config", {})
@@ -611,28 +768,37 @@ class DNDF(Module):
         self.register_buffer("tree_arange", torch.arange(num_tree)[..., None, None])
         self.register_buffer("ones", torch.stack(ones_list))
         self.register_buffer("increment_indices", torch.stack(increment_indices))
-
-    def forward(self, net: Tensor) -> Tensor:
-        num_batch = net.shape[0]
-        tree_net = self.tree_proj(net)
-
+        # `path_indices[i, l]` is the flat (left / right) decision index taken by
+        # leaf `l` at level `i`, right decisions are offset by `num_internals`
+        leaves = np.arange(self._num_leaf)
+        path_indices = []
+        for i in range(self._tree_depth + 1):
+            nodes = 2 ** i - 1 + (leaves >> (self._tree_depth + 1 - i))
+            go_right = (leaves >> (self._tree_depth - i)) & 1
+            path_indices.append(nodes + go_right * self._num_internals)
+        path_indices_ = torch.from_numpy(np.stack(path_indices).astype(np_int_type))
+        self.register_buffer("path_indices", path_indices_, persistent=False)
+
+    def _fused_routes(self, tree_net: Tensor) -> Tensor:
+        # leaf log probabilities are gathered along their paths and summed, which
+        # costs O(depth * num_leaf) per tree and only uses exportable operators
+        shape = tree_net.shape[0], self._num_tree, self._num_internals
+        tree_net = tree_net.view(*shape)
+        log_p = torch.cat([F.logsigmoid(tree_net), F.logsigmoid(-tree_net)], dim=-1)
+        log_routes = log_p[..., self.path_indices].sum(-2)
+        return torch.exp(log_routes).transpose(0, 1)
+
+    def _routes(self, tree_net: Tensor) -> Tensor:
+        # custom autograd functions and `take` cannot be exported, so the fused
+        # routing is used when tracing
+        if torch.jit.is_tracing():
+            return self._fused_routes(tree_net)
+
+        num_batch = tree_net.shape[0]
         num_flat_prob = 2 * self._num_internals
         arange_args = 0, num_flat_prob * num_batch, num_flat_prob
         batch_indices = torch.arange(*arange_args, device=tree_net.device).view(-1, 1)
-
-        if self._fast:
-            routes = Route.apply(
-                tree_net,
-                self.tree_arange,
-                batch_indices,
-                self.ones,
-                self.increment_indices,
-                self._num_tree,
-                num_batch,
-                self._tree_depth,
-                self._num_internals,
-            )
-        else:
+        if not self._fast:
             shape = num_batch, -1, self._num_internals
             p_left = torch.sigmoid(tree_net).view(*shape).transpose(0, 1)
             p_right = 1.0 - p_left
@@ -646,14 +812,63 @@ class DNDF(Module):
                 current_indices = batch_indices + self.increment_indices[i]  # type: ignore
                 current_indices = tree_arange + current_indices[None, ...]
                 routes *= flat_probabilities.take(current_indices)
+            return routes
+
+        route_fn = RecomputedRoute if self._recompute else Route
+        return route_fn.apply(
+            tree_net,
+            self.tree_arange,
+            batch_indices,
+            self.ones,
+            self.increment_indices,
+            self._num_tree,
+            num_batch,
+            self._tree_depth,
+            self._num_internals,
+        )
 
+    def _sparse_forward(self, tree_net: Tensor, top_k: int) -> Tensor:
+        num_batch = tree_net.shape[0]
+        if top_k == 1:
+            shape = num_batch, self._num_tree, self._num_internals
+            tree_net = tree_net.view(*shape)
+            nodes_shape = num_batch, self._num_tree, 1
+            nodes = torch.zeros(*nodes_shape, dtype=torch.long, device=tree_net.device)
+            for _ in range(self._tree_depth + 1):
+                go_right = (tree_net.gather(2, nodes) < 0.0).to(torch.long)
+                nodes = 2 * nodes + 1 + go_right
+            leaf_indices = nodes - self._num_internals
+            probabilities = torch.ones_like(leaf_indices, dtype=tree_net.dtype)
+        else:
+            routes = self._routes(tree_net).transpose(0, 1)
+            probabilities, leaf_indices = routes.topk(top_k, dim=2)
+            probabilities = probabilities / probabilities.sum(2, keepdim=True)
+        if self.leaves is None or self._output_dim is None:
+            shape = num_batch, self._num_tree, self._num_leaf
+            features = torch.zeros(*shape, dtype=tree_net.dtype, device=tree_net.device)
+            return features.scatter(2, leaf_indices, probabilities)
+        leaves = self.leaves
+        if not self._is_regression and self._output_dim > 1:
+            leaves = F.softmax(leaves, dim=1)
+        tree_arange = self.tree_arange.view(1, -1, 1) * self._num_leaf  # type: ignore
+        selected = F.embedding(leaf_indices + tree_arange, leaves)
+        outputs = (probabilities.unsqueeze(-1) * selected).sum(dim=(1, 2))
+        return outputs / self._num_tree
+
+    def forward(self, net: Tensor) -> Tensor:
+        num_batch = net.shape[0]
+        tree_net = self.tree_proj(net)
+        if not self.training and self._inference_top_k is not None:
+            return self._sparse_forward(tree_net, self._inference_top_k)
+
+        routes = self._routes(tree_net)
         features = routes.transpose(0, 1).contiguous().view(num_batch, -1)
         if self.leaves is None or self._output_dim is None:
             return features.view(num_batch, self._num_tree, -1)
         if self._is_regression or self._output_dim <= 1:
             outputs = features.mm(self.leaves)
         else:
-            if self._fast:
+            if self._fast and not torch.jit.is_tracing():
                 outputs = LeafAggregation.apply(features, self.leaves)
             else:
                 leaves = F.softmax(self.leaves, dim=1)
@@ -1131,7 +1346,7 @@ class ConditionalBlocks(Module):
 
 class AttentionOutput(NamedTuple):
     output: Tensor
-    weights: Tensor
+    weights: Optional[Tensor]
 
 
 attentions: Dict[str, Type["Attention"]] = {}
@@ -1155,10 +1370,14 @@ class Attention(Module):
         v_linear_config: Optional[Dict[str, Any]] = None,
         in_linear_config: Optional[Dict[str, Any]] = None,
         out_linear_config: Optional[Dict[str, Any]] = None,
+        chunk_size: Optional[int] = None,
     ):
         super().__init__()
         self.input_dim = input_dim
         self.is_self_attn = is_self_attention
+        # if provided, keys will be processed in chunks with online softmax when
+        # weights are not required, so the full weights will not be stored
+        self.chunk_size = chunk_size
         if not is_self_attention:
             self.k_dim = k_dim or input_dim
             self.v_dim = v_dim or input_dim
@@ -1224,6 +1443,82 @@ class Attention(Module):
     def _weights_callback(self, weights: Tensor) -> Tensor:
         return weights
 
+    def _chunk_bias(self, k_start: int, k_end: int) -> Optional[Tensor]:
+        # additive bias on the raw weights of a chunk, in the `log` space of the
+        # multiplicative adjustments in `_weights_callback`
+        return None
+
+    def _attend_chunk(
+        self,
+        q: Tensor,
+        k: Tensor,
+        v: Tensor,
+        mask: Optional[Tensor],
+        bias: Optional[Tensor],
+    ) -> Tuple[Tensor, Tensor, Tensor]:
+        # B, N_head, Sq, Sc
+        raw_weights = torch.matmul(q, k.transpose(-2, -1))
+        if bias is not None:
+            raw_weights = raw_weights + bias
+        if mask is not None:
+            raw_weights = raw_weights.masked_fill(mask, float("-inf"))
+        chunk_max = raw_weights.amax(-1, keepdim=True)
+        safe_max = torch.where(
+            torch.isinf(chunk_max),
+            torch.zeros_like(chunk_max),
+            chunk_max,
+        )
+        exp_weights = torch.exp(raw_weights - safe_max)
+        exp_sum = exp_weights.sum(-1, keepdim=True)
+        if 0.0 < self.dropout < 1.0:
+            exp_weights = F.dropout(exp_weights, self.dropout, self.training)
+        return chunk_max, exp_sum, torch.matmul(exp_weights, v)
+
+    def _chunked_attention(
+        self,
+        q: Tensor,
+        k: Tensor,
+        v: Tensor,
+        mask: Optional[Tensor],
+    ) -> Tensor:
+        # q, k, v : B, N_head, S*, D_head
+        assert self.chunk_size is not None
+        k_len = k.shape[2]
+        stats_shape = q.shape[:3] + (1,)
+        running_max = q.new_full(stats_shape, float("-inf"))
+        running_sum = q.new_zeros(stats_shape)
+        output = q.new_zeros(*q.shape[:3], v.shape[-1])
+        use_checkpoint = torch.is_grad_enabled() and any(
+            t.requires_grad for t in [q, k, v]
+        )
+        for start in range(0, k_len, self.chunk_size):
+            end = min(start + self.chunk_size, k_len)
+            args = (
+                q,
+                k[..., start:end, :],
+                v[..., start:end, :],
+                None if mask is None else mask[:, None, :, start:end],
+                self._chunk_bias(start, end),
+            )
+            # chunks are recomputed in backward, so their weights are not stored
+            if use_checkpoint:
+                chunk_outputs = checkpoint(self._attend_chunk, *args)
+            else:
+                chunk_outputs = self._attend_chunk(*args)
+            chunk_max, chunk_sum, chunk_output = chunk_outputs
+            new_max = torch.max(running_max, chunk_max)
+            safe_max = torch.where(
+                torch.isinf(new_max),
+                torch.zeros_like(new_max),
+                new_max,
+            )
+            running_scale = torch.exp(running_max - safe_max)
+            chunk_scale = torch.exp(chunk_max - safe_max)
+            running_sum = running_sum * running_scale + chunk_sum * chunk_scale
+            output = output * running_scale + chunk_output * chunk_scale
+            running_max = new_max
+        return output / running_sum
+
     def forward(
         self,
         q: Tensor,
@@ -1231,9 +1526,10 @@ class Attention(Module):
         v: Tensor,
         *,
         mask: Optional[Tensor] = None,
+        return_weights: bool = True,
     ) -> AttentionOutput:
         # `mask` represents slots which will be zeroed
-        k_len = k.shape[1]
+        q_len, k_len = q.shape[1], k.shape[1]
         if self.is_self_attn:
             q, k, v = self.in_linear(q).chunk(3, dim=-1)
         else:
@@ -1248,29 +1544,40 @@ class Attention(Module):
         q = q * self.scaling
         # B, S*, D -> B * N_head, S*, D_head
         q, k, v = map(self._to_heads, [q, k, v])
-        if mask is not None:
-            # B, Sq, Sk -> B * N_head, Sq, Sk
-            mask = mask.repeat(self.num_heads, 1, 1)
-        # B * N_head, Sq, Sk
-        raw_weights = torch.bmm(q, k.transpose(-2, -1))
-        if mask is not None:
-            raw_weights.masked_fill_(mask, float("-inf"))
-        # B * N_head, Sq, Sk -> B * N_head, Sq, Sk
-        weights = self._get_weights(raw_weights)
-        if 0.0 < self.dropout < 1.0:
-            weights = F.dropout(weights, self.dropout, self.training)
-        weights = self._weights_callback(weights)
-        # B * N_head, Sq, D_head
-        output = torch.bmm(weights, v)
-        # B * N_head, Sq, D_head -> B, N_head, Sq, D_head
-        nb, q_len, d_head = output.shape
-        output = output.view(nb // self.num_heads, self.num_heads, q_len, d_head)
+        weights: Optional[Tensor]
+        if self.chunk_size is not None and not return_weights:
+            # B * N_head, S*, D_head -> B, N_head, S*, D_head
+            shapes = [(-1, self.num_heads, *t.shape[1:]) for t in [q, k, v]]
+            q, k, v = [t.view(*shape) for t, shape in zip([q, k, v], shapes)]
+            # B, N_head, Sq, D_head
+            output = self._chunked_attention(q, k, v, mask)
+            weights = None
+        else:
+            # B * N_head, Sq, Sk
+            raw_weights = torch.bmm(q, k.transpose(-2, -1))
+            if mask is not None:
+                # B, Sq, Sk -> B, 1, Sq, Sk, which will be broadcast to each head
+                raw_weights = raw_weights.view(-1, self.num_heads, q_len, k_len)
+                raw_weights = raw_weights.masked_fill(mask[:, None], float("-inf"))
+                raw_weights = raw_weights.view(-1, q_len, k_len)
+            # B * N_head, Sq, Sk -> B * N_head, Sq, Sk
+            weights = self._get_weights(raw_weights)
+            if 0.0 < self.dropout < 1.0:
+                weights = F.dropout(weights, self.dropout, self.training)
+            weights = self._weights_callback(weights)
+            # B * N_head, Sq, D_head
+            output = torch.bmm(weights, v)
+            # B * N_head, Sq, D_head -> B, N_head, Sq, D_head
+            output = output.view(-1, self.num_heads, q_len, self.head_dim)
+            weights = weights.view(-1, self.num_heads, q_len, k_len)
+            if not return_weights:
+                weights = None
         # B, N_head, Sq, D_head -> B, Sq, D
         output = output.permute(0, 2, 1, 3).contiguous()
         output = output.view(-1, q_len, self.embed_dim)
         # B, Sq, D -> B, Sq, Din
         output = self.activation(self.out_linear(output))
-        return AttentionOutput(output, weights.view(-1, self.num_heads, q_len, k_len))
+        return AttentionOutput(output, weights)
 
     @classmethod
     def get(cls, name: str) -> Type["Attention"]:
@@ -1323,7 +1630,7 @@ class PreNorm(nn.Module):
             x_list.append(x_list[1])
         if len(x_list) != 3:
             raise ValueError("there should be three inputs for `Attention`")
-        return self.module(*x_list, **kwargs).output
+        return self.module(*x_list, return_weights=False, **kwargs).output
 
 
 __all__ = [
@@ -12,9 +12,11 @@ from cfdata.tabular.misc import np_int_type
 
 from ..protocol import DataLoaderProtocol
 from ..misc.toolkit import to_torch
+from ..misc.toolkit import to_numpy
 from ..misc.toolkit import Lambda
 from ..misc.toolkit import Initializer
 from ..misc.toolkit import LoggingMixinWithRank
+from ..modules.blocks import Linear
 from ..modules.auxiliary import Dropout
 
 
@@ -35,17 +37,6 @@ class EncodingResult(NamedTuple):
         return torch.cat([self.one_hot, self.embedding], dim=1)
 
 
-class OneHot(nn.Module):
-    def __init__(self, dim: int):
-        super().__init__()
-        one_hot_fn = lambda column: nn.functional.one_hot(column, dim)
-        self.core = Lambda(one_hot_fn, f"one_hot_{dim}")
-        self.dim = dim
-
-    def forward(self, tensor: torch.Tensor) -> torch.Tensor:
-        return self.core(tensor).to(torch.float32)
-
-
 class Embedding(nn.Module):
     def __init__(
         self,
@@ -69,6 +60,74 @@ class Embedding(nn.Module):
         return self.core(tensor)
 
 
+class MixedEmbedding(nn.Module):
+    def __init__(
+        self,
+        frequencies: np.ndarray,
+        out_dim: int,
+        ratios: List[float],
+        scales: List[float],
+        init_method: Optional[str],
+        init_config: Dict[str, Any],
+    ):
+        super().__init__()
+        if len(ratios) != len(scales):
+            raise ValueError("`ratios` and `scales` should have the same length")
+        # rows are sorted by their frequencies, and are then split into blocks,
+        # frequent rows will be placed in the earlier (wider) blocks
+        num_rows = len(frequencies)
+        order = np.argsort(-frequencies, kind="stable")
+        positions = np.empty(num_rows, np_int_type)
+        positions[order] = np.arange(num_rows)
+        self.register_buffer("positions", torch.from_numpy(positions))
+        bounds = np.round(np.cumsum(ratios) / sum(ratios) * num_rows).astype(int)
+        self.blocks = nn.ModuleList()
+        self.projections = nn.ModuleList()
+        self.block_dims: List[int] = []
+        self.block_bounds: List[Tuple[int, int]] = []
+        start = 0
+        for end, scale in zip(bounds, scales):
+            if end <= start:
+                continue
+            block_dim = max(1, min(out_dim, int(round(out_dim * scale))))
+            self.blocks.append(
+                Embedding(end - start, block_dim, init_method, init_config)
+            )
+            if block_dim == out_dim:
+                self.projections.append(nn.Identity())
+            else:
+                self.projections.append(Linear(block_dim, out_dim, bias=False))
+            self.block_dims.append(block_dim)
+            self.block_bounds.append((start, end))
+            start = end
+        # `block_starts[1:]` are used as the boundaries to locate the blocks
+        block_starts = self.positions.new_tensor([s for s, _ in self.block_bounds])
+        self.register_buffer("block_starts", block_starts, persistent=False)
+        self.in_dim, self.out_dim = num_rows, out_dim
+
+    def forward(self, tensor: torch.Tensor) -> torch.Tensor:
+        # indices are sorted by their blocks, so each index is gathered & projected
+        # only once by its own block, and the results are then put back in order
+        positions = self.positions[tensor.reshape(-1)]
+        boundaries = self.block_starts[1:]
+        block_indices = torch.bucketize(positions, boundaries, right=True)
+        order = block_indices.argsort()
+        counts = torch.bincount(block_indices, minlength=len(self.blocks)).tolist()
+        sorted_positions = positions[order].split(counts)
+        nets = []
+        for i, (block, projection) in enumerate(zip(self.blocks, self.projections)):
+            local_positions = sorted_positions[i] - self.block_bounds[i][0]
+            nets.append(projection(block(local_positions)))
+        sorted_net = torch.cat(nets)
+        net = sorted_net.new_empty(sorted_net.shape)
+        net[order] = sorted_net
+        return net.view(*tensor.shape, self.out_dim)
+
+
+# a mersenne prime used by the universal hashing of `hash_embedding`
+hash_prime = 2 ** 31 - 1
+
+
 class Encoder(nn.Module, LoggingMixinWithRank, metaclass=ABCMeta):
     def __init__(
         self,
@@ -83,29 +142,32 @@ class Encoder(nn.Module, LoggingMixinWithRank, metaclass=ABCMeta):
         self._fe_init_method: Optional[str]
         self._fe_init_config: Optional[Dict[str, Any]]
         self._init_config(config)
-        for loader in loaders.values():
-            if loader.enabled_sampling:
-                raise ValueError("`loader` should not enable sampling in `Encoder`")
-            if loader.sampler.shuffle:
-                raise ValueError("`loader` should not be shuffled in `Encoder`")
         self.merged_dim = 0
         self.one_hot_dim = 0
         self.embedding_dim = 0
         dims_tensor = torch.tensor(input_dims, dtype=torch.float32)
         self.register_buffer("input_dims", dims_tensor)
+        if self._track_oob:
+            oob_count = torch.zeros([], dtype=torch.int64)
+            self.register_buffer("oob_count", oob_count, persistent=False)
+            self.register_buffer("oob_total", oob_count.clone(), persistent=False)
         self.tgt_columns = np.array(sorted(categorical_columns), np_int_type)
         self.merged_dims: Dict[int, int] = defaultdict(int)
         self.embeddings = nn.ModuleList()
-        self.one_hot_encoders = nn.ModuleList()
+        self.one_hot_dims: List[int] = []
         self._one_hot_indices: List[int] = []
         self._embed_indices: List[int] = []
         self._embed_dims: List[int] = []
+        self._table_dims = list(input_dims)
+        self._hash_columns: Dict[int, Tuple[int, int]] = {}
         for i, (in_dim, methods, config) in enumerate(
             zip(input_dims, methods_list, configs)
         ):
             if isinstance(methods, str):
                 methods = [methods]
             self._register(i, in_dim, methods, config)
+        # hashing
+        self._init_hashing()
         # fast embedding
         if self.use_embedding and self._use_fast_embed:
             if isinstance(self._unified_embed_dim, int):
@@ -141,17 +203,31 @@ class Encoder(nn.Module, LoggingMixinWithRank, metaclass=ABCMeta):
             if self._fe_init_config is None:
                 self._fe_init_config = self._de_init_config
             assert isinstance(self._fe_init_config, dict)
-            self.embeddings.append(
-                Embedding(
-                    sum(input_dims),
+            fast_embedding: nn.Module
+            if not self._mixed_embedding:
+                fast_embedding = Embedding(
+                    sum(self._table_dims),
                     unified_embed_dim,
                     self._fe_init_method,
                     self._fe_init_config,
                 )
-            )
-            assert isinstance(self.input_dims, torch.Tensor)
-            embed_dims_cumsum = self.input_dims[self._embed_indices].cumsum(0)[:-1]
+            else:
+                fast_embedding = MixedEmbedding(
+                    self._embedding_frequencies(loaders),
+                    unified_embed_dim,
+                    self._mixed_embedding_ratios,
+                    self._mixed_embedding_scales,
+                    self._fe_init_method,
+                    self._fe_init_config,
+                )
+            self.embeddings.append(fast_embedding)
+            table_dims = torch.tensor(self._table_dims, dtype=torch.float32)
+            embed_dims_cumsum = table_dims[self._embed_indices].cumsum(0)[:-1]
             self.register_buffer("embed_dims_cumsum", embed_dims_cumsum)
+        # one hot offsets
+        if self.use_one_hot:
+            one_hot_offsets = torch.from_numpy(np.cumsum([0] + self.one_hot_dims[:-1]))
+            self.register_buffer("one_hot_offsets", one_hot_offsets, persistent=False)
         # embedding dropout
         self.embedding_dropout = None
         if self.use_embedding and 0.0 < self._embed_drop < 1.0:
@@ -161,7 +237,12 @@ class Encoder(nn.Module, LoggingMixinWithRank, metaclass=ABCMeta):
         self.embedding_columns = self.tgt_columns[self._embed_indices]
         self._all_one_hot = len(self.one_hot_columns) == len(input_dims)
         self._all_embedding = len(self.embedding_columns) == len(input_dims)
-        self._compile(loaders)
+        # caches could only be accessed with batch indices
+        self._loaders = {k: v for k, v in loaders.items() if v.return_indices}
+        self._compiled: Set[str] = set()
+        if not self._lazy_compile:
+            for name in self._loaders:
+                self._compile(name)
 
     @property
     def num_one_hot(self) -> int:
@@ -184,40 +265,56 @@ class Encoder(nn.Module, LoggingMixinWithRank, metaclass=ABCMeta):
         x_batch: torch.Tensor,
         batch_indices: Optional[np.ndarray],
         loader_name: Optional[str],
+        out: Optional[torch.Tensor] = None,
     ) -> EncodingResult:
+        # if `out` is provided, encodings will be written into it directly,
+        # with the layout of `EncodingResult.merged`
+        one_hot_out = embedding_out = None
+        if out is not None:
+            one_hot_out = out[..., : self.one_hot_dim]
+            embedding_out = out[..., self.one_hot_dim :]
         keys = None
-        if loader_name is not None:
-            keys = self._get_cache_keys(loader_name)
+        if loader_name is not None and batch_indices is not None:
+            if self._prepare_cache(loader_name):
+                keys = self._get_cache_keys(loader_name)
+        use_cache = keys is not None
         categorical_columns = x_batch[..., self.tgt_columns]
-        if batch_indices is None or loader_name is None:
-            self._oob_imputation(categorical_columns)
-        use_cache = keys is not None and batch_indices is not None
+        if not use_cache:
+            categorical_columns = self._oob_imputation(categorical_columns)
+        elif self._track_oob:
+            oob_cache = getattr(self, keys["oob"])  # type: ignore
+            self._update_oob_statistics(self._unpack_bits(oob_cache[batch_indices]))
         # one hot
         if not self.use_one_hot:
             one_hot = None
         else:
-            if use_cache:
+            if use_cache and self._one_hot_cache == "indices":
+                cache = getattr(self, keys["one_hot_indices"])  # type: ignore
+                one_hot = self._one_hot(cache[batch_indices], one_hot_out)
+            elif use_cache:
                 one_hot = getattr(self, keys["one_hot"])[batch_indices]  # type: ignore
+                if one_hot_out is not None:
+                    one_hot = one_hot_out.copy_(one_hot)
             else:
                 one_hot_columns = categorical_columns
                 if not self._all_one_hot:
                     one_hot_columns = one_hot_columns[..., self._one_hot_indices]
-                one_hot = self._one_hot(one_hot_columns)
+                one_hot = self._one_hot(one_hot_columns, one_hot_out)
         # embedding
         if not self.use_embedding:
             embedding = None
         else:
-            if not use_cache:
-                indices = categorical_columns
-            else:
+            if use_cache:
                 indices = getattr(self, keys["indices"])[batch_indices]  # type: ignore
-            if not self._all_embedding:
-                indices = indices[..., self._embed_indices]
-            if not use_cache and self._use_fast_embed:
-                indices[..., 1:] += self.embed_dims_cumsum
-            embedding = self._embedding(indices.to(torch.long))
+            else:
+                indices = categorical_columns
+                if not self._all_embedding:
+                    indices = indices[..., self._embed_indices]
+            embedding = self._embedding(indices)
             if self.embedding_dropout is not None:
                 embedding = self.embedding_dropout(embedding)
+            if embedding_out is not None:
+                embedding = embedding_out.copy_(embedding)
         return EncodingResult(one_hot, embedding)
 
     def _init_config(self, config: Dict[str, Any]) -> None:
@@ -230,10 +327,30 @@ class Encoder(nn.Module, LoggingMixinWithRank, metaclass=ABCMeta):
             "default_embedding_init_config", {"mean": 0.0, "std": 0.02}
         )
         self._use_fast_embed = config.setdefault("use_fast_embedding", True)
+        # [ dense | indices ]
+        self._one_hot_cache = config.setdefault("one_hot_cache", "dense")
+        if self._one_hot_cache not in ("dense", "indices"):
+            msg = f"one hot cache '{self._one_hot_cache}' is not recognized"
+            raise NotImplementedError(msg)
         # [ mean | median | max | int ]
         self._unified_embed_dim = config.setdefault("unified_embedding_dim", "max")
         self._fe_init_method = config.setdefault("fast_embedding_init_method", None)
         self._fe_init_config = config.setdefault("fast_embedding_init_config", None)
+        # rows of the fast embedding will be sized by their frequencies
+        self._mixed_embedding = config.setdefault("mixed_embedding", False)
+        self._mixed_embedding_ratios = config.setdefault(
+            "mixed_embedding_ratios", [0.1, 0.2, 0.7]
+        )
+        self._mixed_embedding_scales = config.setdefault(
+            "mixed_embedding_scales", [1.0, 0.5, 0.25]
+        )
+        self._hash_seed = config.setdefault("hash_seed", 142857)
+        # caches will be compiled when the first batch of a loader is seen
+        self._lazy_compile = config.setdefault("lazy_compile", True)
+        self._compile_chunk_size = config.setdefault("compile_chunk_size", None)
+        # out of bound statistics will be accumulated on device, and will only
+        # be read in `log_oob_statistics`
+        self._track_oob = config.setdefault("track_oob", False)
 
     def _register(
         self,
@@ -250,7 +367,7 @@ class Encoder(nn.Module, LoggingMixinWithRank, metaclass=ABCMeta):
             attr(i, in_dim, config)
 
     def _register_one_hot(self, i: int, in_dim: int, _: Dict[str, Any]) -> None:
-        self.one_hot_encoders.append(OneHot(in_dim))
+        self.one_hot_dims.append(in_dim)
         self._one_hot_indices.append(i)
         self.merged_dims[i] += in_dim
         self.one_hot_dim += in_dim
@@ -287,90 +404,281 @@ class Encoder(nn.Module, LoggingMixinWithRank, metaclass=ABCMeta):
             self.merged_dim += out_dim
             self.embeddings.append(Embedding(in_dim, out_dim, init_method, init_config))
 
-    def _oob_imputation(
+    def _register_hash_embedding(
         self,
-        categorical_columns: torch.Tensor,
-        batch_indices: Optional[np.ndarray] = None,
-        loader_name: Optional[str] = None,
+        i: int,
+        in_dim: int,
+        config: Dict[str, Any],
     ) -> None:
-        if loader_name is None or batch_indices is None:
-            oob_mask = categorical_columns >= self.input_dims
-        else:
-            keys = self._get_cache_keys(loader_name)
-            oob_mask = getattr(self, keys["oob"])[batch_indices].to(torch.bool)
-        if torch.any(oob_mask):
-            self.log_msg(  # type: ignore
-                "out of bound occurred, "
-                f"ratio : {torch.mean(oob_mask.to(torch.float32)).item():8.6f}",
-                prefix=self.warning_prefix,  # type: ignore
-                verbose_level=5,
-                msg_level=logging.WARNING,
-            )
-            # TODO : currently pytorch does not support onnx with bool masks
-            #        in the future this line should be un-indented
-            categorical_columns[oob_mask] = 0.0
+        num_buckets = config.setdefault("num_buckets", 2 ** 16)
+        num_hashes = config.setdefault("num_hashes", 2)
+        if num_hashes < 1:
+            raise ValueError(f"`num_hashes` should be positive, {num_hashes} found")
+        # hashing is not necessary if all categories fit into the buckets
+        if in_dim <= num_buckets:
+            self._register_embedding(i, in_dim, config)
+            return
+        self._table_dims[i] = num_buckets
+        self._hash_columns[i] = num_buckets, num_hashes
+        self._register_embedding(i, num_buckets, config)
+
+    def _init_hashing(self) -> None:
+        # positions (among embedding columns) which use the k-th hash function
+        self._hash_positions: List[List[int]] = []
+        if not self._hash_columns:
+            return
+        num_hashes = [0] * self.num_embedding
+        num_buckets = [hash_prime] * self.num_embedding
+        for i, (buckets, hashes) in self._hash_columns.items():
+            position = self._embed_indices.index(i)
+            num_buckets[position], num_hashes[position] = buckets, hashes
+        for k in range(max(num_hashes)):
+            positions = [p for p, num in enumerate(num_hashes) if num > k]
+            self._hash_positions.append(positions)
+        shape = len(self._hash_positions), self.num_embedding
+        random_state = np.random.RandomState(self._hash_seed)
+        hash_a = random_state.randint(1, hash_prime, shape, dtype=np.int64)
+        hash_b = random_state.randint(0, hash_prime, shape, dtype=np.int64)
+        # columns without hashing will be kept as-is, because indices are
+        # always smaller than `hash_prime`
+        identity = [p for p, num in enumerate(num_hashes) if num == 0]
+        hash_a[..., identity] = 1
+        hash_b[..., identity] = 0
+        self.register_buffer("hash_a", torch.from_numpy(hash_a), persistent=False)
+        self.register_buffer("hash_b", torch.from_numpy(hash_b), persistent=False)
+        buckets_tensor = torch.tensor(num_buckets, dtype=torch.int64)
+        self.register_buffer("hash_buckets", buckets_tensor, persistent=False)
+
+    def _log_oob_ratio(self, ratio: float) -> None:
+        self.log_msg(  # type: ignore
+            f"out of bound occurred, ratio : {ratio:8.6f}",
+            prefix=self.warning_prefix,  # type: ignore
+            verbose_level=5,
+            msg_level=logging.WARNING,
+        )
+
+    def _update_oob_statistics(self, oob_mask: torch.Tensor) -> None:
+        if not self._track_oob or torch.jit.is_tracing():
+            return
+        self.oob_count += oob_mask.sum()
+        self.oob_total += oob_mask.numel()
+
+    def _embedding_frequencies(
+        self,
+        loaders: Dict[str, DataLoaderProtocol],
+    ) -> np.ndarray:
+        num_rows = sum(self._table_dims)
+        loader = loaders.get("tr")
+        if loader is None:
+            return np.zeros(num_rows, np_int_type)
+        x = loader.data.processed.x
+        columns = to_torch(x[..., self.tgt_columns[self._embed_indices]])
+        oob_mask = columns >= self.input_dims[self._embed_indices]
+        columns = torch.where(oob_mask, torch.zeros_like(columns), columns)
+        indices = columns.to(torch.long)
+        table_dims = [self._table_dims[i] for i in self._embed_indices]
+        offsets = torch.from_numpy(np.cumsum([0] + table_dims[:-1]))
+        if not self._hash_positions:
+            flat = to_numpy(indices + offsets).ravel()
+            return np.bincount(flat, minlength=num_rows)
+        # rows reached by every hash function in `_embedding` are counted
+        frequencies = np.zeros(num_rows, np.int64)
+        for k, positions in enumerate(self._hash_positions):
+            hashed = self._hash(indices, k) + offsets
+            if k > 0:
+                hashed = hashed[..., positions]
+            flat = to_numpy(hashed).ravel()
+            frequencies += np.bincount(flat, minlength=num_rows)
+        return frequencies
+
+    def _oob_imputation(self, categorical_columns: torch.Tensor) -> torch.Tensor:
+        oob_mask = categorical_columns >= self.input_dims
+        self._update_oob_statistics(oob_mask)
+        # `torch.where` imputes without synchronizing with the host
+        zeros = torch.zeros_like(categorical_columns)
+        return torch.where(oob_mask, zeros, categorical_columns)
+
+    def log_oob_statistics(self, *, reset: bool = True) -> Optional[float]:
+        # this will synchronize with the device, so it should only be called
+        # when logging (e.g. at snapshots)
+        if not self._track_oob:
+            return None
+        total = int(self.oob_total.item())
+        ratio = 0.0 if total == 0 else int(self.oob_count.item()) / total
+        if ratio > 0.0:
+            self._log_oob_ratio(ratio)
+        if reset:
+            self.oob_count.zero_()
+            self.oob_total.zero_()
+        return ratio
 
     @staticmethod
     def _to_split(columns: torch.Tensor) -> List[torch.Tensor]:
         return list(columns.to(torch.long).t().unbind())
 
-    def _one_hot(self, one_hot_columns: torch.Tensor) -> torch.Tensor:
-        split = self._to_split(one_hot_columns)
-        encodings = [
-            encoder(flat_feature)
-            for encoder, flat_feature in zip(self.one_hot_encoders, split)
-        ]
-        return torch.cat(encodings, dim=1)
+    def _one_hot(
+        self,
+        one_hot_columns: torch.Tensor,
+        out: Optional[torch.Tensor] = None,
+    ) -> torch.Tensor:
+        # all columns are encoded at once by scattering into the merged one hot
+        # matrix, with columns shifted by the offsets of their encodings
+        positions = one_hot_columns.to(torch.long) + self.one_hot_offsets
+        if out is None:
+            shape = len(positions), self.one_hot_dim
+            out = torch.zeros(shape, dtype=torch.float32, device=positions.device)
+        else:
+            out.zero_()
+        return out.scatter_(1, positions, 1.0)
+
+    @staticmethod
+    def _compact_int_type(num_values: int) -> torch.dtype:
+        if num_values <= 2 ** 8:
+            return torch.uint8
+        if num_values <= 2 ** 15:
+            return torch.int16
+        return torch.int32
+
+    @staticmethod
+    def _pack_bits(mask: torch.Tensor) -> torch.Tensor:
+        packed = torch.from_numpy(np.packbits(to_numpy(mask), axis=-1))
+        return packed.to(mask.device)
+
+    def _unpack_bits(self, packed: torch.Tensor) -> torch.Tensor:
+        shifts = torch.arange(7, -1, -1, dtype=torch.uint8, device=packed.device)
+        bits = (packed.unsqueeze(-1) >> shifts) & 1
+        bits = bits.view(*packed.shape[:-1], -1)[..., : len(self.tgt_columns)]
+        return bits.to(torch.bool)
+
+    def _hash(self, indices_columns: torch.Tensor, k: int) -> torch.Tensor:
+        hashed = indices_columns * self.hash_a[k] + self.hash_b[k]
+        return hashed % hash_prime % self.hash_buckets
+
+    def _fast_embedding(
+        self,
+        indices_columns: torch.Tensor,
+        positions: Optional[List[int]] = None,
+    ) -> torch.Tensor:
+        offsets = nn.functional.pad(self.embed_dims_cumsum, [1, 0]).to(torch.long)
+        if positions is not None:
+            offsets = offsets[positions]
+        return self.embeddings[0](indices_columns + offsets)
 
     def _embedding(self, indices_columns: torch.Tensor) -> torch.Tensor:
+        indices_columns = indices_columns.to(torch.long)
+        looked_up = indices_columns
+        if self._hash_positions:
+            looked_up = self._hash(indices_columns, 0)
+        if self._use_fast_embed:
+            embed_mat = self._fast_embedding(looked_up)
+        else:
+            split = self._to_split(looked_up)
+            encodings = [
+                embedding(flat_feature)
+                for embedding, flat_feature in zip(self.embeddings, split)
+            ]
+        # embeddings of multiple hash functions are combined by summation
+        for k in range(1, len(self._hash_positions)):
+            positions = self._hash_positions[k]
+            hashed = self._hash(indices_columns, k)[..., positions]
+            if self._use_fast_embed:
+                hashed_mat = self._fast_embedding(hashed, positions)
+                index = torch.tensor(positions, device=hashed.device)
+                embed_mat = embed_mat.index_add(1, index, hashed_mat)
+            else:
+                for position, flat_feature in zip(positions, self._to_split(hashed)):
+                    hashed_encoding = self.embeddings[position](flat_feature)
+                    encodings[position] = encodings[position] + hashed_encoding
         if self._use_fast_embed:
-            embed_mat = self.embeddings[0](indices_columns)
             return embed_mat.view(-1, self.embedding_dim)
-        split = self._to_split(indices_columns)
-        encodings = [
-            embedding(flat_feature)
-            for embedding, flat_feature in zip(self.embeddings, split)
-        ]
         return torch.cat(encodings, dim=1)
 
     @staticmethod
     def _get_cache_keys(name: str) -> Dict[str, str]:
         return {
             "one_hot": f"{name}_one_hot_cache",
+            "one_hot_indices": f"{name}_one_hot_indices_cache",
             "indices": f"{name}_indices_cache",
             "oob": f"{name}_oob_cache",
         }
 
-    def _compile(self, loaders: Dict[str, DataLoaderProtocol]) -> None:
-        for name, loader in loaders.items():
-            categorical_features = []
-            return_indices = loader.return_indices
-            for sample in loader:
-                if return_indices:
-                    assert isinstance(sample, tuple)
-                    sample = sample[0]
-                assert isinstance(sample, dict)
-                x_batch = sample["x_batch"]
-                categorical_features.append(x_batch[..., self.tgt_columns])
-            tensor = to_torch(np.vstack(categorical_features))
-            keys = self._get_cache_keys(name)
-            # compile oob
-            oob = (tensor >= self.input_dims).to(torch.float32)
-            self.register_buffer(keys["oob"], oob)
-            self._oob_imputation(
-                tensor,
-                batch_indices=np.arange(len(tensor)),
-                loader_name=name,
-            )
-            # compile one hot
-            if self.use_one_hot:
-                one_hot_cache = self._one_hot(tensor[..., self._one_hot_indices])
-                self.register_buffer(keys["one_hot"], one_hot_cache)
-            # compile embedding
-            if self.use_embedding and self._use_fast_embed:
-                tensor[..., 1:] += self.embed_dims_cumsum
-                indices = tensor.to(torch.long)
-                self.register_buffer(keys["indices"], indices.to(torch.float32))
-
+    def _prepare_cache(self, name: str) -> bool:
+        if name in self._compiled:
+            return True
+        if name not in self._loaders:
+            return False
+        self._compile(name)
+        return True
+
+    def _compile(self, name: str) -> None:
+        # caches are built from the processed data directly, in chunks of
+        # `compile_chunk_size` rows if provided
+        x = self._loaders[name].data.processed.x
+        chunk_size = self._compile_chunk_size or max(1, len(x))
+        device = self.input_dims.device
+        chunks: Dict[str, List[torch.Tensor]] = defaultdict(list)
+        num_oob = 0
+        for start in range(0, len(x), chunk_size):
+            categorical_features = x[start : start + chunk_size, self.tgt_columns]
+            tensor = to_torch(categorical_features).to(device)
+            oob_mask = tensor >= self.input_dims
+            num_oob += int(oob_mask.sum().item())
+            for key, cache in self._compile_chunk(tensor, oob_mask).items():
+                chunks[key].append(cache)
+        if num_oob > 0:
+            self._log_oob_ratio(num_oob / (len(x) * len(self.tgt_columns)))
+        keys = self._get_cache_keys(name)
+        for key, caches in chunks.items():
+            self.register_buffer(keys[key], torch.cat(caches), persistent=False)
+        self._compiled.add(name)
+
+    def _compile_chunk(
+        self,
+        tensor: torch.Tensor,
+        oob_mask: torch.Tensor,
+    ) -> Dict[str, torch.Tensor]:
+        # compile oob, out of bound flags are packed into bits
+        caches = {"oob": self._pack_bits(oob_mask)}
+        tensor = torch.where(oob_mask, torch.zeros_like(tensor), tensor)
+        # compile one hot
+        if self.use_one_hot:
+            one_hot_columns = tensor[..., self._one_hot_indices]
+            if self._one_hot_cache == "dense":
+                caches["one_hot"] = self._one_hot(one_hot_columns)
+            else:
+                # only category indices are cached, one hot encodings will
+                # be generated with a single `scatter` in each batch
+                dtype = self._compact_int_type(max(self.one_hot_dims))
+                caches["one_hot_indices"] = one_hot_columns.to(dtype)
+        # compile embedding
+        if self.use_embedding:
+            # raw indices are cached, because hashing and offsets are
+            # applied in `_embedding`
+            embed_dims = self.input_dims[self._embed_indices]
+            dtype = self._compact_int_type(int(embed_dims.max().item()))
+            caches["indices"] = tensor[..., self._embed_indices].to(dtype)
+        return caches
+
+    def _load_from_state_dict(
+        self,
+        state_dict: Dict[str, Any],
+        prefix: str,
+        local_metadata: Dict[str, Any],
+        *args: Any,
+        **kwargs: Any,
+    ) -> None:
+        # caches are compiled from the data and are not persistent, so caches
+        # saved by previous versions are simply dropped
+        for key in list(state_dict):
+            name = key[len(prefix) :]
+            if key.startswith(prefix) and "." not in name and name.endswith("_cache"):
+                state_dict.pop(key)
+        super()._load_from_state_dict(
+            state_dict,
+            prefix,
+            local_metadata,
+            *args,
+            **kwargs,
+        )
 
 __all__ = ["Encoder", "EncodingResult"]
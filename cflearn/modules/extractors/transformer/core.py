@@ -65,6 +65,7 @@ class DecayedAttention(Attention):
         v_linear_config: Optional[Dict[str, Any]] = None,
         in_linear_config: Optional[Dict[str, Any]] = None,
         out_linear_config: Optional[Dict[str, Any]] = None,
+        chunk_size: Optional[int] = None,
     ):
         super().__init__(
             input_dim,
@@ -81,23 +82,49 @@ class DecayedAttention(Attention):
             v_linear_config=v_linear_config,
             in_linear_config=in_linear_config,
             out_linear_config=out_linear_config,
+            chunk_size=chunk_size,
         )
         mask = np.zeros([seq_len, seq_len], dtype=np.float32)
         for i in range(1, seq_len):
             np.fill_diagonal(mask[i:], i ** 2)
         mask_ = torch.from_numpy(mask)
-        decayed_mask = torch.empty(num_heads, seq_len, seq_len)
+        log_decayed_mask = torch.empty(num_heads, seq_len, seq_len)
         for i in range(num_heads):
-            decayed_mask[i] = torch.exp(-(0.1 ** (i + 3)) * mask_)
-        self.register_buffer("decayed_mask", decayed_mask)
+            log_decayed_mask[i] = -(0.1 ** (i + 3)) * mask_
+        # only the log decayed mask is kept, and the decayed mask is derived
+        self.register_buffer("log_decayed_mask", log_decayed_mask, persistent=False)
+
+    def _chunk_bias(self, k_start: int, k_end: int) -> Optional[Tensor]:
+        # re-normalizing decayed softmax weights is identical to applying softmax
+        # on raw weights shifted by the log decayed mask
+        return self.log_decayed_mask[None, ..., k_start:k_end]  # type: ignore
 
     def _weights_callback(self, weights: Tensor) -> Tensor:
         last_shapes = weights.shape[1:]
         weights = weights.view(-1, self.num_heads, *last_shapes)
-        weights = weights * self.decayed_mask
+        weights = weights * torch.exp(self.log_decayed_mask)
         weights = weights / (torch.sum(weights, dim=3).unsqueeze(3) + 1.0e-8)
         return weights.view(-1, *last_shapes)
 
+    def _load_from_state_dict(
+        self,
+        state_dict: Dict[str, Any],
+        prefix: str,
+        local_metadata: Dict[str, Any],
+        *args: Any,
+        **kwargs: Any,
+    ) -> None:
+        # decayed masks are built from the configurations, so the ones saved by
+        # previous versions are simply dropped
+        state_dict.pop(f"{prefix}decayed_mask", None)
+        super()._load_from_state_dict(
+            state_dict,
+            prefix,
+            local_metadata,
+            *args,
+            **kwargs,
+        )
+
 
 class TransformerLayer(nn.Module):
     def __init__(
@@ -111,6 +138,7 @@ class TransformerLayer(nn.Module):
         norm_type: str = "layer_norm",
         attention_type: str = "decayed",
         seq_len: Optional[int] = None,
+        attention_chunk_size: Optional[int] = None,
         attention_config: Optional[Dict[str, Any]] = None,
         activation_config: Optional[Dict[str, Any]] = None,
         to_latent_config: Optional[Dict[str, Any]] = None,
@@ -122,6 +150,7 @@ class TransformerLayer(nn.Module):
             attention_config = {}
         attention_config["is_self_attention"] = True
         attention_config.setdefault("dropout", dropout)
+        attention_config.setdefault("chunk_size", attention_chunk_size)
         attn_base = Attention.get(attention_type)
         if attention_type == "decayed":
             if seq_len is None:
@@ -17,6 +17,8 @@ from ...misc.toolkit import LoggingMixinWithRank
 class SplitFeatures(NamedTuple):
     categorical: Optional[EncodingResult]
     numerical: Optional[Tensor]
+    # [ one_hot | embedding ], which `categorical` are views of, if provided
+    merged: Optional[Tensor] = None
 
     def merge(
         self,
@@ -24,6 +26,9 @@ class SplitFeatures(NamedTuple):
         use_embedding: bool = True,
         only_categorical: bool = False,
     ) -> Tensor:
+        narrowed = self._narrow(use_one_hot, use_embedding, only_categorical)
+        if narrowed is not None:
+            return narrowed
         if use_embedding and use_one_hot:
             return self._merge_all(only_categorical)
         numerical = None if only_categorical else self.numerical
@@ -53,6 +58,26 @@ class SplitFeatures(NamedTuple):
             return one_hot
         return torch.cat([numerical, one_hot], dim=1)
 
+    def _narrow(
+        self,
+        use_one_hot: bool,
+        use_embedding: bool,
+        only_categorical: bool,
+    ) -> Optional[Tensor]:
+        if self.merged is None or self.categorical is None:
+            return None
+        # numerical features are views of the inputs, so only the categorical
+        # parts, which are always contiguous, could be narrowed from `merged`
+        if not only_categorical and self.numerical is not None:
+            return None
+        one_hot = self.categorical.one_hot
+        one_hot_dim = 0 if one_hot is None else one_hot.shape[-1]
+        start = 0 if use_one_hot else one_hot_dim
+        end = self.merged.shape[-1] if use_embedding else one_hot_dim
+        if start >= end:
+            return None
+        return self.merged[..., start:end]
+
     def _merge_all(self, only_categorical: bool) -> Tensor:
         categorical = self.categorical
         if categorical is None:
@@ -60,7 +85,7 @@ class SplitFeatures(NamedTuple):
                 raise ValueError("categorical is not available")
             assert self.numerical is not None
             return self.numerical
-        merged = categorical.merged
+        merged = categorical.merged if self.merged is None else self.merged
         if only_categorical or self.numerical is None:
             return merged
         return torch.cat([self.numerical, merged], dim=1)
@@ -80,6 +105,16 @@ class Dimensions(LoggingMixinWithRank):
         self.categorical_columns_mapping = categorical_columns_mapping
         self._numerical_columns = sorted(numerical_columns_mapping.values())
         self.num_history = num_history
+        self._plan_layout()
+
+    def _plan_layout(self) -> None:
+        # numerical columns will be fetched with a slice (which is a view of the
+        # inputs) if they are contiguous, otherwise with cached index tensors
+        columns = self._numerical_columns
+        self._numerical_slice: Optional[slice] = None
+        if columns and columns == list(range(columns[0], columns[-1] + 1)):
+            self._numerical_slice = slice(columns[0], columns[-1] + 1)
+        self._numerical_indices: Dict[torch.device, Tensor] = {}
 
     @property
     def merged_dim(self) -> int:
@@ -122,15 +157,27 @@ class Dimensions(LoggingMixinWithRank):
     ) -> SplitFeatures:
         if self.encoder is None:
             return SplitFeatures(None, x_batch)
-        with timing_context(self, "encoding", enable=enable_timing):
-            encoding_result = self.encoder(x_batch, batch_indices, loader_name)
+        # encodings of each batch will be written into one merged tensor, so
+        # transforms could simply narrow it instead of concatenating
+        merged = None
+        if x_batch.dim() == 2 and not torch.jit.is_tracing():
+            merged = x_batch.new_empty(len(x_batch), self._categorical_dim)
         with timing_context(self, "fetch_numerical", enable=enable_timing):
-            numerical_columns = self._numerical_columns
-            if not numerical_columns:
-                numerical = None
-            else:
-                numerical = x_batch[..., numerical_columns]
-        return SplitFeatures(encoding_result, numerical)
+            numerical = self._fetch_numerical(x_batch)
+        with timing_context(self, "encoding", enable=enable_timing):
+            encoding_result = self.encoder(x_batch, batch_indices, loader_name, merged)
+        return SplitFeatures(encoding_result, numerical, merged)
+
+    def _fetch_numerical(self, x_batch: Tensor) -> Optional[Tensor]:
+        if not self._numerical_columns:
+            return None
+        if self._numerical_slice is not None:
+            return x_batch[..., self._numerical_slice]
+        indices = self._numerical_indices.get(x_batch.device)
+        if indices is None:
+            indices = torch.tensor(self._numerical_columns, device=x_batch.device)
+            self._numerical_indices[x_batch.device] = indices
+        return x_batch.index_select(-1, indices)
 
 
 class Transform(Module):
@@ -14,6 +14,7 @@ from abc import ABC
 from tqdm import tqdm
 from cfdata.tabular import TabularDataset
 from cftool.ml import ModelPattern
+from cftool.misc import update_dict
 from cftool.misc import show_or_save
 from cftool.misc import shallow_copy_dict
 from cftool.misc import lock_manager
@@ -33,11 +34,13 @@ from .trainer import Trainer
 from .trainer import IntermediateResults
 from .protocol import DataProtocol
 from .protocol import PrefetchLoader
+from .protocol import SamplerProtocol
 from .protocol import DataLoaderProtocol
 from .inference import Inference
 from .inference import PreProcessor
 from .misc._api import _fetch_saving_paths
 from .misc.toolkit import to_2d
+from .misc.toolkit import hash_data
 from .misc.toolkit import to_relative
 from .misc.toolkit import eval_context
 from .misc.toolkit import LoggingMixinWithRank
@@ -151,10 +154,16 @@ class Pipeline(LoggingMixinWithRank):
             self.sampler_protocol,
             self.sampler_config,
         )
+        tr_sampler_kwargs: Dict[str, Any] = {}
+        sampler_base = SamplerProtocol.get(self.sampler_protocol)
+        if self.environment.ddp and sampler_base.is_distributed:
+            tr_sampler_kwargs["rank"] = self.environment.rank
+            tr_sampler_kwargs["world_size"] = self.environment.world_size
         tr_sampler = self.preprocessor.make_sampler(
             self.tr_data,
             self.shuffle_tr,
             self.tr_weights,
+            **tr_sampler_kwargs,
         )
 
         if self.batch_size is None:  # type: ignore
@@ -162,7 +171,16 @@ class Pipeline(LoggingMixinWithRank):
             self.batch_size = 2 ** int(round(math.log2(self.batch_size)))
             self.config["lr_ratio"] = math.log2(self.batch_size / 128)
 
+        if self.data_residency not in ("host", "device"):
+            raise ValueError(f"unrecognized data_residency '{self.data_residency}'")
+        resident_kwargs: Dict[str, Any] = {}
+        if self.data_residency == "device":
+            resident_kwargs = {"use_feature_store": True, "device": self.device}
         tr_loader_kwargs = self.config.get("tr_loader_kwargs", {})
+        tr_loader_kwargs = update_dict(
+            shallow_copy_dict(tr_loader_kwargs),
+            shallow_copy_dict(resident_kwargs),
+        )
         self.tr_loader = DataLoaderProtocol.make(
             self.loader_protocol,
             self.batch_size,
@@ -176,6 +194,10 @@ class Pipeline(LoggingMixinWithRank):
             self.cv_loader = None
         else:
             cv_loader_kwargs = self.config.get("cv_loader_kwargs", {})
+            cv_loader_kwargs = update_dict(
+                shallow_copy_dict(cv_loader_kwargs),
+                shallow_copy_dict(resident_kwargs),
+            )
             cv_sampler = self.preprocessor.make_sampler(self.cv_data, False)
             self.cv_loader = DataLoaderProtocol.make(
                 self.loader_protocol,
@@ -257,8 +279,7 @@ class Pipeline(LoggingMixinWithRank):
         self.sample_weights: Optional[np.ndarray] = None
         if sample_weights is not None:
             self.sample_weights = sample_weights.copy()
-        self._original_data = DataProtocol.make(self.data_protocol, **self.data_config)
-        self._original_data.read(*args, **self.read_config)
+        self._original_data = self._read_data(args)
         self.tr_data = self._original_data
         self._save_original_data = x_cv is None
         self.tr_weights = self.cv_weights = None
@@ -292,6 +313,44 @@ class Pipeline(LoggingMixinWithRank):
         # deep speed
         self.set_rank_0(self.is_rank_0)
 
+    def _read_data(self, args: Tuple[data_type, ...]) -> DataProtocol:
+        if self.data_cache_folder is None:
+            data = DataProtocol.make(self.data_protocol, **self.data_config)
+            return data.read(*args, **self.read_config)
+        # processed data is cached by the content of inputs & configs, so
+        # repeated fits on the same data could skip the whole reading process
+        data_config = shallow_copy_dict(self.data_config)
+        # these settings do not affect the results
+        runtime_keys = ["verbose_level", "trigger_logging", "use_timing_context"]
+        for key in runtime_keys + ["num_jobs"]:
+            data_config.pop(key, None)
+        key = hash_data(*args, self.data_protocol, data_config, self.read_config)
+        cache_folder = os.path.abspath(self.data_cache_folder)
+        data_folder = os.path.join(cache_folder, key)
+        data_base = DataProtocol.get(self.data_protocol)
+        if os.path.isdir(data_folder):
+            self.log_msg(  # type: ignore
+                f"loading cached data from '{data_folder}'",
+                self.info_prefix,
+                verbose_level=2,
+            )
+            return data_base.load(
+                data_folder,
+                compress=False,
+                verbose_level=self._verbose_level,
+            )
+        data = DataProtocol.make(self.data_protocol, **self.data_config)
+        data.read(*args, **self.read_config)
+        os.makedirs(cache_folder, exist_ok=True)
+        tmp_folder = f"{data_folder}_{os.getpid()}_tmp"
+        data.save(tmp_folder, compress=False, mmap=True)
+        try:
+            os.rename(tmp_folder, data_folder)
+        except OSError:
+            # the same data has been cached by another process
+            shutil.rmtree(tmp_folder)
+        return data
+
     def _handle_pretrain(
         self,
         strict: bool,
@@ -708,6 +767,7 @@ class Pipeline(LoggingMixinWithRank):
         *,
         compress: bool = True,
         remove_original: bool = True,
+        mmap_data: bool = False,
     ) -> "Pipeline":
         if export_folder is None:
             export_folder = self.trainer.checkpoint_folder
@@ -724,11 +784,15 @@ class Pipeline(LoggingMixinWithRank):
                 assert self.cv_data is not None
                 train_data_folder = os.path.join(data_folder, self.train_folder)
                 valid_data_folder = os.path.join(data_folder, self.valid_folder)
-                self.tr_data.save(train_data_folder, compress=False)
-                self.cv_data.save(valid_data_folder, compress=False)
+                self.tr_data.save(train_data_folder, compress=False, mmap=mmap_data)
+                self.cv_data.save(valid_data_folder, compress=False, mmap=mmap_data)
             else:
                 original_data_folder = os.path.join(data_folder, self.original_folder)
-                self._original_data.save(original_data_folder, compress=False)
+                self._original_data.save(
+                    original_data_folder,
+                    compress=False,
+                    mmap=mmap_data,
+                )
                 if self.tr_split_indices is not None:
                     tr_file = os.path.join(data_folder, self.train_indices_file)
                     np.save(tr_file, self.tr_split_indices)
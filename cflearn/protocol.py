@@ -1,9 +1,11 @@
 import os
 import json
 import math
+import queue
 import torch
 import pprint
 import logging
+import threading
 
 import numpy as np
 import datatable as dt
@@ -151,6 +153,7 @@ class DataProtocol(ABC):
         compress: bool = True,
         retain_data: bool = True,
         remove_original: bool = True,
+        mmap: bool = False,
     ) -> "DataProtocol":
         pass
 
@@ -199,11 +202,17 @@ class DataProtocol(ABC):
 
 class SamplerProtocol(ABC):
     shuffle: bool
+    is_distributed: bool = False
 
     @abstractmethod
     def __init__(self, data: DataProtocol, **kwargs: Any):
         self.data = data
 
+    def set_epoch(self, epoch: int) -> None:
+        # samplers which depend on the epoch (e.g. distributed samplers) should
+        # override this method, it will be called at the start of every epoch
+        pass
+
     @classmethod
     def get(cls, name: str) -> Type["SamplerProtocol"]:
         return sampler_dict[name]
@@ -294,12 +303,16 @@ class PrefetchLoader:
         *,
         is_onnx: bool = False,
         enable_prefetch: bool = False,
+        background_prefetch: bool = False,
+        prefetch_depth: int = 2,
     ):
         self.loader = loader
         self.device = device
         self.is_onnx = is_onnx
         loader.is_onnx = is_onnx
         self.enable_prefetch = enable_prefetch
+        self.background_prefetch = background_prefetch
+        self.prefetch_depth = prefetch_depth
         self.data = loader.data
         self.return_indices = loader.return_indices
         self.stream = None if not self.use_stream else torch.cuda.Stream(device)
@@ -307,13 +320,20 @@ class PrefetchLoader:
         self.next_batch_indices: Optional[torch.Tensor]
         self.stop_at_next_batch = False
         self.batch_size = loader.batch_size
+        self._queue: Optional[queue.Queue] = None
+        self._stop_event: Optional[threading.Event] = None
+        self._worker: Optional[threading.Thread] = None
+        self._check_buffers()
 
     def __len__(self) -> int:
         return len(self.loader)
 
     def __iter__(self) -> "PrefetchLoader":
         self.stop_at_next_batch = False
+        self._stop_worker()
         self.loader.__iter__()
+        if self.use_background_prefetch:
+            self._start_worker()
         self.preload()
         return self
 
@@ -341,9 +361,59 @@ class PrefetchLoader:
             indices_tensor = indices_tensor.to(self.device, **kwargs)  # type: ignore
             self.next_batch_indices = indices_tensor
 
+    # batches are produced by a background thread behind a bounded queue, the
+    # underlying loader is a stateful iterator so one producer is sufficient
+
+    def _produce(self, stop_event: threading.Event, batch_queue: queue.Queue) -> None:
+        while not stop_event.is_set():
+            try:
+                sample = self.loader.__next__()
+            except StopIteration:
+                sample = StopIteration()
+            except Exception as err:
+                sample = err
+            while not stop_event.is_set():
+                try:
+                    batch_queue.put(sample, timeout=0.1)
+                    break
+                except queue.Full:
+                    continue
+            if isinstance(sample, Exception):
+                break
+
+    def _start_worker(self) -> None:
+        self._stop_event = threading.Event()
+        self._queue = queue.Queue(max(1, self.prefetch_depth))
+        self._worker = threading.Thread(
+            target=self._produce,
+            args=(self._stop_event, self._queue),
+            daemon=True,
+        )
+        self._worker.start()
+
+    def _stop_worker(self) -> None:
+        if self._stop_event is None or self._worker is None:
+            return None
+        self._stop_event.set()
+        self._worker.join()
+        self._queue = self._stop_event = self._worker = None
+
+    def close(self) -> None:
+        # stops the background producer, if any, before the epoch is exhausted
+        self._stop_worker()
+
+    def _next_sample(self) -> loader_batch_type:
+        if self._queue is None:
+            return self.loader.__next__()
+        sample = self._queue.get()
+        if isinstance(sample, Exception):
+            self._stop_worker()
+            raise sample
+        return sample
+
     def preload(self) -> None:
         try:
-            sample = self.loader.__next__()
+            sample = self._next_sample()
         except StopIteration:
             self.stop_at_next_batch = True
             return None
@@ -352,7 +422,10 @@ class PrefetchLoader:
             indices_tensor = None
         else:
             sample, batch_indices = sample  # type: ignore
-            indices_tensor = to_torch(batch_indices).to(torch.long)  # type: ignore
+            if isinstance(batch_indices, torch.Tensor):
+                indices_tensor = batch_indices.to(torch.long)
+            else:
+                indices_tensor = to_torch(batch_indices).to(torch.long)  # type: ignore
 
         self.next_batch = sample  # type: ignore
         if self.is_cpu:
@@ -377,6 +450,33 @@ class PrefetchLoader:
     def use_stream(self) -> bool:
         return self.enable_prefetch and not self.is_cpu
 
+    @property
+    def use_background_prefetch(self) -> bool:
+        return self.background_prefetch and self.is_cpu
+
+    @property
+    def num_alive_batches(self) -> int:
+        # the returned batch and the preloaded one, plus the queued batches and
+        # the one held by the producer when a background worker is used
+        if not self.use_background_prefetch:
+            return 2
+        return max(1, self.prefetch_depth) + 3
+
+    def _check_buffers(self) -> None:
+        # batches gathered into a ring of buffers are overwritten after
+        # `num_buffers` more batches, so the ring should outlive every batch
+        # which could be alive at the same time
+        num_buffers = getattr(self.loader, "num_buffers", 0)
+        if num_buffers <= 0 or not getattr(self.loader, "use_feature_store", False):
+            return None
+        if num_buffers < self.num_alive_batches:
+            raise ValueError(
+                f"`num_buffers` ({num_buffers}) should be at least "
+                f"{self.num_alive_batches} (`prefetch_depth`={self.prefetch_depth}, "
+                f"`background_prefetch`={self.background_prefetch}), otherwise "
+                "batches will be overwritten before they are consumed"
+            )
+
 
 class TrainerState:
     def __init__(self, trainer_config: Dict[str, Any]):
@@ -556,9 +656,14 @@ class ModelProtocol(nn.Module, LoggingMixinWithRank, metaclass=ABCMeta):
         if self.config is None:
             return None
         ema_decay = self.config.setdefault("ema_decay", 0.0)
+        ema_update_every = self.config.setdefault("ema_update_every", 1)
         if 0.0 < ema_decay < 1.0:
             named_params = list(self.named_parameters())
-            self.ema = EMA(ema_decay, named_params)  # type: ignore
+            self.ema = EMA(  # type: ignore
+                ema_decay,
+                named_params,
+                update_every=ema_update_every,
+            )
 
     def apply_ema(self) -> None:
         if self.ema is None:
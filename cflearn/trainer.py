@@ -879,6 +879,9 @@ class Trainer(MonitoredMixin):
                     self._log_artifacts()
                 if self.state.should_log_metrics_msg:
                     self._log_metrics_msg(self.intermediate)
+                    encoder = getattr(self.model, "encoder", None)
+                    if encoder is not None:
+                        encoder.log_oob_statistics()
 
             if self.state.should_start_snapshot:
                 timing_name = "monitor.prune_trial"
@@ -946,25 +949,28 @@ class Trainer(MonitoredMixin):
         *,
         enable_prefetch: bool = True,
     ) -> None:
+        prefetch_kwargs = {
+            "enable_prefetch": enable_prefetch,
+            "prefetch_depth": self.config.setdefault("prefetch_depth", 2),
+        }
+        # only the training loader is consumed batch after batch, so it is the
+        # only one which is prefetched in the background
         self.tr_loader = PrefetchLoader(
             tr_loader,
             self.device,
-            enable_prefetch=enable_prefetch,
+            background_prefetch=self.config.setdefault("background_prefetch", False),
+            **prefetch_kwargs,
         )
         self.tr_loader_copy = PrefetchLoader(
             tr_loader_copy,
             self.device,
-            enable_prefetch=enable_prefetch,
+            **prefetch_kwargs,
         )
         self.cv_loader: Optional[PrefetchLoader]
         if cv_loader is None:
             self.cv_loader = None
         else:
-            self.cv_loader = PrefetchLoader(
-                cv_loader,
-                self.device,
-                enable_prefetch=enable_prefetch,
-            )
+            self.cv_loader = PrefetchLoader(cv_loader, self.device, **prefetch_kwargs)
         self.state.inject_loader(tr_loader)
         # sample weights
         tr_weights_ = None if tr_weights is None else to_torch(tr_weights)
@@ -987,13 +993,7 @@ class Trainer(MonitoredMixin):
         if show_summary is None:
             show_summary = not self.tqdm_settings.in_distributed
         if self.is_rank_0 and not self.is_loading:
-            next_item = next(iter(self.tr_loader_copy))
-            if self.tr_loader_copy.return_indices:
-                assert isinstance(next_item, tuple)
-                sample_batch = next_item[0]
-            else:
-                assert isinstance(next_item, dict)
-                sample_batch = next_item
+            sample_batch, _ = next(iter(self.tr_loader_copy))
             summary_msg = summary(
                 self.model,
                 sample_batch,
@@ -1016,6 +1016,7 @@ class Trainer(MonitoredMixin):
         while self.state.should_train:
             try:
                 self.state.epoch += 1
+                self.tr_loader.loader.sampler.set_epoch(self.state.epoch)
                 step_iterator = self.tr_loader
                 if self.tqdm_settings.use_step_tqdm:
                     step_tqdm = step_iterator = tqdm(
@@ -1048,6 +1049,7 @@ class Trainer(MonitoredMixin):
                 assert self._epoch_tqdm is not None
                 self._epoch_tqdm.total = self.state.num_epoch
                 self._epoch_tqdm.update()
+        self.tr_loader.close()
         if self.use_tqdm:
             if step_tqdm is not None:
                 step_tqdm.close()
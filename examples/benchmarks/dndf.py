@@ -0,0 +1,60 @@
+import time
+import torch
+
+import numpy as np
+import torch.nn.functional as F
+
+from typing import Any
+from typing import Callable
+from cflearn.modules.blocks import DNDF
+
+# for reproduction
+torch.manual_seed(142857)
+
+# prepare
+d = 128
+k = 10
+batch_size = 1024
+num_repeat = 20
+
+net = torch.randn(batch_size, d)
+
+
+def dense_path_matrix(dndf: DNDF) -> torch.Tensor:
+    # dense path membership matrix, which makes routing O(num_leaf ** 2)
+    path_indices = dndf.path_indices.numpy()
+    path_matrix = np.zeros([2 * dndf._num_internals, dndf._num_leaf], np.float32)
+    np.put_along_axis(path_matrix, path_indices, 1.0, axis=0)
+    return torch.from_numpy(path_matrix)
+
+
+def dense_routes(dndf: DNDF, matrix: torch.Tensor, net_: torch.Tensor) -> torch.Tensor:
+    x = net_.view(net_.shape[0], dndf._num_tree, dndf._num_internals)
+    log_p = torch.cat([F.logsigmoid(x), F.logsigmoid(-x)], dim=-1)
+    return torch.exp(log_p.matmul(matrix)).transpose(0, 1)
+
+
+def timeit(fn: Callable[[torch.Tensor], Any], tree_net: torch.Tensor) -> float:
+    t = time.time()
+    for _ in range(num_repeat):
+        local_net = tree_net.clone().requires_grad_(True)
+        fn(local_net).log().mean().backward()
+    return (time.time() - t) / num_repeat
+
+
+if __name__ == "__main__":
+    for tree_depth in [4, 7, 10]:
+        print(f"tree_depth={tree_depth}")
+        slow = DNDF(d, k, tree_depth=tree_depth, use_fast_dndf=False)
+        fast = DNDF(d, k, tree_depth=tree_depth, use_fast_dndf=True)
+        fast.load_state_dict(slow.state_dict())
+        tree_net = slow.tree_proj(net).detach()
+        path_matrix = dense_path_matrix(fast)
+        fns = {
+            "take loop": slow._routes,
+            "Route": fast._routes,
+            "fused": fast._fused_routes,
+            "dense": lambda x: dense_routes(fast, path_matrix, x),
+        }
+        for name, fn in fns.items():
+            print(f"  {name:<10s}: {timeit(fn, tree_net):8.6f}s / step")
@@ -0,0 +1,66 @@
+import time
+import torch
+
+import torch.nn as nn
+
+from typing import Any
+from typing import Callable
+from cflearn.modules import EMA
+
+# for reproduction
+torch.manual_seed(142857)
+
+# prepare
+decay = 0.999
+num_layers = 8
+hidden_units = 1024
+num_repeat = 50
+
+device = "cuda:0" if torch.cuda.is_available() else "cpu"
+layers = [nn.Linear(hidden_units, hidden_units) for _ in range(num_layers)]
+model = nn.Sequential(*layers).to(device)
+named_params = list(model.named_parameters())
+
+
+def legacy_step(ema: EMA) -> None:
+    # the previous implementation, which cloned every parameter twice per step
+    for name, param in ema.tgt_params:
+        setattr(ema, ema.get_name(True, name), param.data.clone())
+        ema_name = ema.get_name(False, name)
+        ema_attr = getattr(ema, ema_name)
+        new_ema = (1.0 - ema._decay) * param.data + ema._decay * ema_attr
+        setattr(ema, ema_name, new_ema.clone())
+
+
+def timeit(fn: Callable[[], Any]) -> float:
+    fn()
+    if device != "cpu":
+        torch.cuda.synchronize()
+    t = time.time()
+    for _ in range(num_repeat):
+        fn()
+    if device != "cpu":
+        torch.cuda.synchronize()
+    return (time.time() - t) / num_repeat
+
+
+if __name__ == "__main__":
+    ema = EMA(decay, named_params).to(device)
+    legacy_t = timeit(lambda: legacy_step(ema))
+    print(f"legacy            : {legacy_t:8.6f}s / step")
+    for update_every in [1, 4]:
+        ema = EMA(decay, named_params, update_every=update_every).to(device)
+        t = timeit(ema)
+        print(f"update_every={update_every:<4d} : {t:8.6f}s / step")
+    # in place updates should match the legacy ones
+    ema = EMA(decay, named_params).to(device)
+    legacy_ema = EMA(decay, named_params).to(device)
+    for _ in range(3):
+        with torch.no_grad():
+            for param in model.parameters():
+                param.add_(torch.randn_like(param))
+        ema()
+        legacy_step(legacy_ema)
+    for name, _ in ema.tgt_params:
+        ema_name = ema.get_name(False, name)
+        assert torch.allclose(getattr(ema, ema_name), getattr(legacy_ema, ema_name))
@@ -0,0 +1,63 @@
+import time
+import torch
+
+import torch.nn.functional as F
+
+from typing import Any
+from typing import List
+from typing import Callable
+from cflearn.modules import Encoder
+
+# for reproduction
+torch.manual_seed(142857)
+
+# prepare
+num_columns = 64
+batch_size = 4096
+num_repeat = 50
+
+device = "cuda:0" if torch.cuda.is_available() else "cpu"
+input_dims = torch.randint(2, 32, [num_columns]).tolist()
+columns = torch.stack([torch.randint(dim, [batch_size]) for dim in input_dims], 1)
+columns = columns.to(torch.float32).to(device)
+encoder = Encoder(
+    {},
+    input_dims,
+    ["one_hot"] * num_columns,
+    [{} for _ in range(num_columns)],
+    list(range(num_columns)),
+    {},
+).to(device)
+
+
+def legacy_one_hot(dims: List[int], one_hot_columns: torch.Tensor) -> torch.Tensor:
+    # the previous implementation, which encoded every column separately
+    split = one_hot_columns.to(torch.long).t().unbind()
+    encodings = [
+        F.one_hot(column, dim).to(torch.float32) for column, dim in zip(split, dims)
+    ]
+    return torch.cat(encodings, dim=1)
+
+
+def timeit(fn: Callable[[], Any]) -> float:
+    fn()
+    if device != "cpu":
+        torch.cuda.synchronize()
+    t = time.time()
+    for _ in range(num_repeat):
+        fn()
+    if device != "cpu":
+        torch.cuda.synchronize()
+    return (time.time() - t) / num_repeat
+
+
+if __name__ == "__main__":
+    legacy_t = timeit(lambda: legacy_one_hot(input_dims, columns))
+    print(f"legacy  : {legacy_t:8.6f}s / batch")
+    scatter_t = timeit(lambda: encoder._one_hot(columns))
+    print(f"scatter : {scatter_t:8.6f}s / batch")
+    out = torch.empty(batch_size, encoder.one_hot_dim, device=device)
+    out_t = timeit(lambda: encoder._one_hot(columns, out))
+    print(f"out=    : {out_t:8.6f}s / batch")
+    # the scattered encodings should match the legacy ones
+    assert torch.equal(encoder._one_hot(columns), legacy_one_hot(input_dims, columns))
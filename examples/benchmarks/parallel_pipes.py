@@ -0,0 +1,53 @@
+import time
+import torch
+import cflearn
+
+import numpy as np
+
+from cflearn.misc.toolkit import eval_context
+
+# for reproduction
+np.random.seed(142857)
+torch.manual_seed(142857)
+
+# prepare
+num_pipes = 4
+num_data = 10000
+num_features = 64
+hidden_units = [512, 512, 512]
+batch_size = 256
+num_repeat = 20
+
+x = np.random.random([num_data, num_features])
+y = np.random.randint(0, 2, [num_data, 1])
+
+pipes = [cflearn.PipeInfo(f"fcnn_{i}", head="fcnn") for i in range(num_pipes)]
+cflearn.register_model("multi_fcnn", pipes=pipes)
+pipe_configs = {
+    f"fcnn_{i}": {"head": {"hidden_units": hidden_units}} for i in range(num_pipes)
+}
+
+
+if __name__ == "__main__":
+    m = cflearn.make(
+        "multi_fcnn",
+        model_config={"pipe_configs": pipe_configs},
+        fixed_epoch=1,
+        verbose_level=0,
+        cuda="cpu",
+    ).fit(x, y)
+    model = m.model
+    batch = {"x_batch": torch.from_numpy(x[:batch_size].astype(np.float32))}
+    results = {}
+    for parallel_pipes in [False, True]:
+        model.parallel_pipes = parallel_pipes
+        with eval_context(model):
+            model(batch)
+            t = time.time()
+            for _ in range(num_repeat):
+                outputs = model(batch)
+        elapsed = (time.time() - t) / num_repeat
+        print(f"parallel_pipes={parallel_pipes} : {elapsed:8.6f}s / batch")
+        results[parallel_pipes] = outputs["predictions"]
+    assert torch.allclose(results[False], results[True])
+    cflearn._rmtree("_logs")
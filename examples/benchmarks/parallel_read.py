@@ -0,0 +1,30 @@
+import time
+import cflearn
+
+import numpy as np
+
+# for reproduction
+np.random.seed(142857)
+
+# prepare
+num_data = 2000
+num_numerical = 4000
+num_categorical = 1000
+
+numerical = np.random.random([num_data, num_numerical])
+categorical = np.random.randint(0, 10, [num_data, num_categorical])
+x = np.hstack([numerical, categorical])
+y = np.random.randint(0, 2, [num_data, 1])
+
+if __name__ == "__main__":
+    results = {}
+    elapsed = {}
+    for num_jobs in [1, 8]:
+        data = cflearn.TabularData(num_jobs=num_jobs, verbose_level=0)
+        t = time.time()
+        data.read(x, y)
+        elapsed[num_jobs] = time.time() - t
+        print(f"num_jobs={num_jobs} : {elapsed[num_jobs]:8.4f}s")
+        results[num_jobs] = data
+    print(f"speedup    : {elapsed[1] / elapsed[8]:8.4f}x")
+    assert results[1] == results[8]
@@ -16,7 +16,7 @@ setup(
         "plotly",
         "optuna>=2.3.0",
         "carefree-ml>=0.1.1",
-        "carefree-data>=0.2.4",
+        "carefree-data>=0.2.9,<0.3.0",
         "carefree-toolkit>=0.2.7",
         "dill",
         "future",
@@ -6,6 +6,9 @@ import numpy as np
 import torch.nn as nn
 
 from cflearn.modules.blocks import *
+from cflearn.modules.blocks import Route
+from cflearn.modules.encoders import MixedEmbedding
+from cflearn.modules.extractors.transformer.core import DecayedAttention
 
 
 class TestBlocks(unittest.TestCase):
@@ -86,6 +89,98 @@ class TestBlocks(unittest.TestCase):
             print(f"slow : {slow_t} ; fast : {fast_t}")
             self.assertTrue(fast_t < slow_t)
 
+    def test_fused_dndf_routes(self) -> None:
+        d = 64
+        k = 10
+        batch_size = 256
+
+        net = torch.randn(batch_size, d)
+        for tree_depth in [1, 4, 7]:
+            dndf = DNDF(d, k, tree_depth=tree_depth)
+            tree_net = dndf.tree_proj(net).detach()
+            results = []
+            for routes_fn in [dndf._routes, dndf._fused_routes]:
+                local_net = tree_net.clone().requires_grad_(True)
+                routes = routes_fn(local_net)
+                routes.log().mean().backward()
+                results.append((routes.detach(), local_net.grad))
+            (r1, g1), (r2, g2) = results
+            # fused routing works in log space, so results differ by round-off
+            self.assertTrue(torch.allclose(r1, r2, rtol=1e-4))
+            self.assertTrue(torch.allclose(g1, g2, rtol=1e-4, atol=1e-7))
+
+    def test_recomputed_dndf(self) -> None:
+        d = 128
+        k = 10
+        batch_size = 256
+
+        inp = torch.randn(batch_size, d)
+        dndf = DNDF(d, k, tree_depth=6)
+        dndf_recompute = DNDF(d, k, tree_depth=6, recompute=True)
+        dndf_recompute.load_state_dict(dndf.state_dict())
+
+        grads = []
+        for m in [dndf, dndf_recompute]:
+            net = inp.clone().requires_grad_(True)
+            outputs = m(net)
+            outputs.log().mean().backward()
+            grads.append((outputs, net.grad, m.tree_proj.weight.grad))
+        for t1, t2 in zip(*grads):
+            self.assertTrue(torch.allclose(t1, t2))
+
+    def test_sparse_dndf(self) -> None:
+        d = 64
+        k = 10
+        tree_depth = 3
+        batch_size = 128
+
+        net = torch.randn(batch_size, d)
+        for out_dim in [k, 1, None]:
+            dndf = DNDF(d, out_dim, tree_depth=tree_depth).eval()
+            with torch.no_grad():
+                soft = dndf(net)
+                dndf._inference_top_k = 2 ** (tree_depth + 1)
+                self.assertTrue(torch.allclose(soft, dndf(net), atol=1e-6))
+                dndf._inference_top_k = 1
+                hard = dndf(net)
+            if out_dim is not None:
+                self.assertEqual(hard.shape, soft.shape)
+                continue
+            # argmax path should be the only leaf with every route >= 0.5
+            num_flat_prob = 2 * (2 ** (tree_depth + 1) - 1)
+            arange_args = 0, num_flat_prob * batch_size, num_flat_prob
+            batch_indices = torch.arange(*arange_args).view(-1, 1)
+            all_routes = Route._routes(
+                dndf.tree_proj(net),
+                dndf.tree_arange,
+                batch_indices,
+                dndf.increment_indices,
+                dndf._num_tree,
+                batch_size,
+                tree_depth,
+                2 ** (tree_depth + 1) - 1,
+            )[1]
+            greedy = (torch.stack(all_routes) >= 0.5).all(0).transpose(0, 1)
+            self.assertTrue(torch.equal(greedy, hard > 0))
+
+    def test_mixed_embedding(self) -> None:
+        num_rows = 100
+        out_dim = 16
+        batch_size = 32
+
+        frequencies = np.random.random(num_rows)
+        args = [0.1, 0.2, 0.7], [1.0, 0.5, 0.25], None, {}
+        embedding = MixedEmbedding(frequencies, out_dim, *args)  # type: ignore
+        net = torch.randint(num_rows, [batch_size, 3])
+        outputs = embedding(net)
+        self.assertEqual(outputs.shape, (batch_size, 3, out_dim))
+        blocks = zip(embedding.block_bounds, embedding.blocks, embedding.projections)
+        for (start, end), block, projection in blocks:
+            positions = embedding.positions[net]
+            mask = (positions >= start) & (positions < end)
+            expected = projection(block.weights[positions[mask] - start])
+            self.assertTrue(torch.allclose(outputs[mask], expected))
+
     def test_invertible(self) -> None:
         dim = 512
         batch_size = 32
@@ -165,7 +260,7 @@ class TestBlocks(unittest.TestCase):
 
         permute = lambda t: t.permute(1, 0, 2)
         qt, kt, vt = map(permute, [q, k, v])
-        torch_attn_mask = mask.repeat(num_heads, 1, 1)
+        torch_attn_mask = mask.repeat_interleave(num_heads, dim=0)
         torch_output = torch_attention(qt, kt, vt, attn_mask=torch_attn_mask)[0]
 
         attention = Attention(input_dim, num_heads)
@@ -183,6 +278,45 @@ class TestBlocks(unittest.TestCase):
 
         self.assertTrue(torch.allclose(permute(torch_output), output))
 
+        chunked = Attention(input_dim, num_heads, chunk_size=7)
+        chunked.load_state_dict(attention.state_dict())
+        chunked_outputs = chunked(q, k, v, mask=mask, return_weights=False)
+        self.assertIsNone(chunked_outputs.weights)
+        self.assertTrue(torch.allclose(output, chunked_outputs.output, atol=1e-5))
+
+    def test_chunked_decayed_attention(self) -> None:
+        num_heads = 4
+        input_dim = 64
+        batch_size = 16
+        seq_len = 50
+
+        net = torch.randn(batch_size, seq_len, input_dim, requires_grad=True)
+        attention = DecayedAttention(
+            input_dim,
+            num_heads,
+            seq_len=seq_len,
+            is_self_attention=True,
+        )
+        chunked = DecayedAttention(
+            input_dim,
+            num_heads,
+            seq_len=seq_len,
+            is_self_attention=True,
+            chunk_size=16,
+        )
+        state_dict = attention.state_dict()
+        self.assertNotIn("decayed_mask", state_dict)
+        # decayed masks saved by previous versions should be ignored
+        state_dict["decayed_mask"] = torch.exp(attention.log_decayed_mask)
+        chunked.load_state_dict(state_dict)
+        grads = []
+        for m in [attention, chunked]:
+            output = m(net, net, net, return_weights=False).output
+            (g,) = torch.autograd.grad(output.sum(), net)
+            grads.append((output, g))
+        for t1, t2 in zip(*grads):
+            self.assertTrue(torch.allclose(t1, t2, atol=1e-5))
+
 
 if __name__ == "__main__":
     unittest.main()
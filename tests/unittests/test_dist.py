@@ -42,6 +42,27 @@ class TestDist(unittest.TestCase):
         )
         cflearn._rmtree(logging_folder)
 
+    def test_ddp_sampler(self) -> None:
+        data = cflearn.TabularData.from_dataset(TabularDataset.iris())
+        world_size = 4
+        samplers = [
+            cflearn.TabularDDPSampler(data, rank=rank, world_size=world_size)
+            for rank in range(world_size)
+        ]
+        indices = [sampler.get_indices() for sampler in samplers]
+        num_samples = len(data)
+        self.assertTrue(all(len(sampler) == len(indices[0]) for sampler in samplers))
+        self.assertEqual(len(samplers[0]) * world_size, num_samples + 2)
+        merged = np.hstack(indices)
+        self.assertEqual(set(merged.tolist()), set(range(num_samples)))
+        # indices should only change when `epoch` is set
+        self.assertTrue(np.array_equal(indices[0], samplers[0].get_indices()))
+        samplers[0].set_epoch(1)
+        next_indices = samplers[0].get_indices()
+        self.assertFalse(np.array_equal(indices[0], next_indices))
+        samplers[0].shuffle = False
+        self.assertEqual(len(samplers[0]), num_samples)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -1,6 +1,9 @@
+import torch
 import cflearn
 import unittest
 
+import numpy as np
+
 x_numerical = [[1.2], [3.4], [5.6]]
 x_categorical = [[1.0], [3.0], [5.0]]
 x_mix = [xn + xc for xn, xc in zip(x_numerical, x_categorical)]
@@ -86,6 +89,83 @@ class TestToy(unittest.TestCase):
         cflearn.make_toy_model("ddr", config=cfg, data_tuple=(x_categorical, y_reg))
         cflearn._rmtree("_logs")
 
+    def test_parallel_pipes_toy(self) -> None:
+        config = {"model_config": {"parallel_pipes": True}}
+        for model in ["wnd", "nnb"]:
+            m = cflearn.make_toy_model(
+                model,
+                config=config,
+                task_type="clf",
+                data_tuple=(x_mix, y_clf),  # type: ignore
+            )
+            prob = m.predict_prob(x_mix)
+            m.model.parallel_pipes = False
+            self.assertTrue(np.allclose(prob, m.predict_prob(x_mix)))
+        cflearn._rmtree("_logs")
+
+    def test_group_heads_toy(self) -> None:
+        pipes = [
+            cflearn.PipeInfo(f"linear_{i}", extractor="identity", head="linear")
+            for i in range(3)
+        ]
+        cflearn.register_model("multi_linear", pipes=pipes)
+        m = cflearn.make_toy_model(
+            "multi_linear",
+            config={"model_config": {"group_heads": True}},
+            task_type="clf",
+            data_tuple=(x_mix, y_clf),  # type: ignore
+        )
+        model = m.model
+        keys = list(model.heads)
+        self.assertEqual(len(model._head_groups), 3)
+        prob = m.predict_prob(x_mix)
+        # parameters of grouped heads should be views of one stacked storage
+        weights = [model.heads[key].linear.weight for key in keys]
+        storages = {weight.storage().data_ptr() for weight in weights}
+        self.assertEqual(len(storages), 1)
+        # outputs & gradients should be identical to the ungrouped ones
+        net = torch.randn(5, model.heads[keys[0]].in_dim)
+        for extracted_list in [[net] * 3, [torch.randn_like(net) for _ in keys]]:
+            results = []
+            for use_group in [True, False]:
+                model.zero_grad()
+                cloned = {id(t): t.clone().requires_grad_(True) for t in extracted_list}
+                inputs = [cloned[id(t)] for t in extracted_list]
+                if use_group:
+                    outputs = model._grouped_linear_heads(keys, inputs)
+                else:
+                    outputs = [model.heads[k](t) for k, t in zip(keys, inputs)]
+                torch.stack(outputs).sum().backward()
+                grads = [t.grad for t in inputs]
+                grads += [p.grad.clone() for p in model.heads.parameters()]
+                results.append([o.detach() for o in outputs] + grads)
+            for t1, t2 in zip(*results):
+                self.assertTrue(torch.allclose(t1, t2, atol=1e-6))
+        # heads with hooks should be called as modules
+        called = []
+        head = model.heads[keys[0]]
+        handle = head.register_forward_hook(lambda *_: called.append(True))
+        self.assertTrue(np.allclose(prob, m.predict_prob(x_mix)))
+        self.assertTrue(called)
+        handle.remove()
+        model._head_groups = {}
+        self.assertTrue(np.allclose(prob, m.predict_prob(x_mix)))
+        cflearn._rmtree("_logs")
+
+    def test_ema_toy(self) -> None:
+        config = {"ema_decay": 0.5, "ema_update_every": 2}
+        m = cflearn.make_toy_model(
+            config=config,
+            task_type="clf",
+            data_tuple=(x_mix, y_clf),  # type: ignore
+        )
+        assert m.model.ema is not None
+        prob = m.predict_prob(x_mix)
+        m.model.train()
+        m.model.eval()
+        self.assertTrue(np.allclose(prob, m.predict_prob(x_mix)))
+        cflearn._rmtree("_logs")
+
 
 if __name__ == "__main__":
     unittest.main()
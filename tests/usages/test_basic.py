@@ -1,4 +1,5 @@
 import os
+import math
 import cflearn
 
 import numpy as np
@@ -84,11 +85,169 @@ def test_array_dataset() -> None:
     cflearn._remove()
 
 
+def test_data_residency() -> None:
+    x = np.random.random([1000, 20])
+    y = np.random.random([1000, 1])
+    for data_residency in ["host", "device"]:
+        m = cflearn.make(
+            task_type="reg",
+            data_residency=data_residency,
+            **kwargs,  # type: ignore
+        ).fit(x, y)
+        assert m.tr_loader.use_feature_store == (data_residency == "device")
+        cflearn._rmtree(logging_folder)
+
+
+def test_feature_store() -> None:
+    dataset = TabularDataset.iris()
+    m = cflearn.make(
+        cv_split=0.0,
+        tr_loader_kwargs={"use_feature_store": True, "num_buffers": 4},
+        model_config={"default_encoding_method": "one_hot"},
+        **kwargs,  # type: ignore
+    ).fit(*dataset.xy)
+    assert m.tr_loader.use_feature_store
+    cflearn.evaluate(*dataset.xy, pipelines=m)
+    cflearn._rmtree(logging_folder)
+
+
+def test_mmap_data() -> None:
+    dataset = TabularDataset.iris()
+    m = cflearn.make(cv_split=0.0, **kwargs).fit(*dataset.xy)  # type: ignore
+    mmap_folder = os.path.join(logging_folder, "__mmap__")
+    m.save(mmap_folder, compress=False, mmap_data=True)
+    m2 = cflearn.Pipeline.load(mmap_folder, compress=False)
+    assert isinstance(m2.tr_data.processed.x, np.memmap)
+    assert m.tr_data == m2.tr_data
+    cflearn.evaluate(*dataset.xy, pipelines=m2)
+    cflearn._rmtree(logging_folder)
+
+
+def test_view_split() -> None:
+    dataset = TabularDataset.iris()
+    split = TabularData.from_dataset(dataset).split(0.1)
+    view_data = cflearn.TabularData.from_dataset(dataset, view_split=True)
+    view_split = view_data.split(0.1)
+    assert view_split.split.is_view
+    assert view_split.split == split.split
+    assert view_split.remained == split.remained
+    assert view_split.split.materialize() == split.split
+    for converter in view_data.converters.values():
+        if converter is not None:
+            assert len(converter._converted_features) == len(view_data)
+
+
+def test_parallel_read() -> None:
+    x = np.hstack([np.random.random([1000, 20]), np.random.randint(0, 5, [1000, 20])])
+    y = np.random.randint(0, 2, [1000, 1])
+    serial = cflearn.TabularData(verbose_level=0).read(x, y)
+    parallel = cflearn.TabularData(num_jobs=4, verbose_level=0).read(x, y)
+    assert serial == parallel
+    assert serial.transform(x, y) == parallel.transform(x, y)
+
+
+def test_hash_embedding() -> None:
+    for use_fast_embedding in [True, False]:
+        m = cflearn.make(
+            model_config={
+                "default_encoding_method": ["one_hot", "hash_embedding"],
+                "default_encoding_configs": {"num_buckets": 2, "num_hashes": 2},
+                "encoder_config": {
+                    "use_fast_embedding": use_fast_embedding,
+                    "lazy_compile": use_fast_embedding,
+                    "mixed_embedding": use_fast_embedding,
+                    "compile_chunk_size": 500,
+                },
+            },
+            **kwargs,  # type: ignore
+        ).fit(tr_file, x_cv=cv_file)
+        cflearn.save(m)
+        m2 = cflearn.load()["fcnn"][0]
+        pred1 = m.predict(te_file, contains_labels=True)
+        pred2 = m2.predict(te_file, contains_labels=True)
+        assert np.allclose(pred1, pred2)  # type: ignore
+        cflearn._rmtree(logging_folder)
+        cflearn._remove()
+
+
+def test_background_prefetch() -> None:
+    m = cflearn.make(
+        trainer_config={"background_prefetch": True},
+        **kwargs,  # type: ignore
+    ).fit(tr_file, x_cv=cv_file)
+    loader = m.tr_loader_copy
+    synchronous = list(cflearn.PrefetchLoader(loader, "cpu"))
+    prefetch_loader = cflearn.PrefetchLoader(loader, "cpu", background_prefetch=True)
+    prefetched = list(prefetch_loader)
+    assert prefetch_loader._worker is None
+    assert len(synchronous) == len(prefetched) == len(loader)
+    for (batch1, indices1), (batch2, indices2) in zip(synchronous, prefetched):
+        assert set(batch1) == set(batch2)
+        for key, value in batch1.items():
+            assert np.allclose(value.numpy(), batch2[key].numpy())
+        assert np.array_equal(indices1.numpy(), indices2.numpy())
+    # the background producer should be stopped when an epoch is abandoned
+    next(iter(prefetch_loader))
+    prefetch_loader.close()
+    assert prefetch_loader._worker is None
+    cflearn._rmtree(logging_folder)
+
+
+def test_one_hot_cache() -> None:
+    for one_hot_cache in ["dense", "indices"]:
+        m = cflearn.make(
+            model_config={
+                "default_encoding_method": "one_hot",
+                "encoder_config": {
+                    "one_hot_cache": one_hot_cache,
+                    "lazy_compile": False,
+                },
+            },
+            **kwargs,  # type: ignore
+        ).fit(tr_file, x_cv=cv_file)
+        cache_key = "one_hot_indices" if one_hot_cache == "indices" else "one_hot"
+        assert hasattr(m.model.encoder, f"tr_{cache_key}_cache")
+        cflearn.save(m)
+        m2 = cflearn.load()["fcnn"][0]
+        pred1 = m.predict(te_file, contains_labels=True)
+        pred2 = m2.predict(te_file, contains_labels=True)
+        assert np.allclose(pred1, pred2)  # type: ignore
+        cflearn._rmtree(logging_folder)
+        cflearn._remove()
+
+
+def test_finetune() -> None:
+    m = cflearn.make(**kwargs).fit(tr_file, x_cv=cv_file)  # type: ignore
+    cflearn.save(m)
+    m2 = cflearn.finetune(tr_file, x_cv=cv_file, freeze_extractors=True)
+    assert set(m2.model._feature_caches) == {"tr", "cv"}
+    states = m2.model.encoder.state_dict()
+    for key, value in m.model.encoder.state_dict().items():
+        assert np.allclose(value.cpu().numpy(), states[key].cpu().numpy())
+    cflearn._rmtree("_logs")
+    cflearn._rmtree(logging_folder)
+    cflearn._remove()
+
+
 def test_file_dataset() -> None:
     fcnn = cflearn.make(**kwargs)  # type: ignore
     tree_dnn = cflearn.make("tree_dnn", **kwargs)  # type: ignore
     fcnn.fit(tr_file, x_cv=cv_file)
     tree_dnn.fit(tr_file, x_cv=cv_file)
+    cache_folder = "__test_data_cache__"
+    model_config = {
+        "default_encoding_method": "one_hot",
+        "encoder_config": {"one_hot_cache": "indices", "track_oob": True},
+    }
+    for _ in range(2):
+        cached = cflearn.make(
+            data_cache_folder=cache_folder,
+            model_config=model_config,
+            **kwargs,  # type: ignore
+        )
+        cached.fit(tr_file, x_cv=cv_file)
+        assert fcnn.tr_data == cached.tr_data
+    cflearn._rmtree(cache_folder)
     pipeline_list = [fcnn, tree_dnn]
     cflearn.evaluate(tr_file, pipelines=pipeline_list, contains_labels=True)
     cflearn.evaluate(cv_file, pipelines=pipeline_list, contains_labels=True)
@@ -254,8 +413,44 @@ def test_auto_file() -> None:
     os.remove(f"{export_name}.zip")
 
 
+def test_stream_dataset() -> None:
+    stream_kwargs = {
+        "data_protocol": "tabular_stream",
+        "loader_protocol": "tabular_stream",
+        "sampler_protocol": "tabular_stream",
+        "data_config": {"num_fit_samples": 1000, "chunk_size": 256},
+        "sampler_config": {"buffer_size": 512},
+    }
+    stream_kwargs.update(kwargs)
+    m = cflearn.make(**stream_kwargs).fit(tr_file)  # type: ignore
+    assert m.tr_data.is_stream and not m.cv_data.is_stream
+    assert len(m.tr_data) + len(m.cv_data) == len(m.data)
+    indices = [chunk.indices for chunk in m.tr_loader.sampler.get_chunks()]
+    assert len(np.unique(np.hstack(indices))) == len(m.tr_data)
+    cflearn.evaluate(te_file, pipelines=m, contains_labels=True)
+    cflearn._rmtree(logging_folder)
+    x = np.random.random([5000, 6])
+    y = (x[..., :1] > 0.5).astype(np.float64)
+    npy_file = os.path.join(file_folder, "__stream__.npy")
+    np.save(npy_file, np.hstack([x, y]))
+    m = cflearn.make(**stream_kwargs).fit(npy_file)  # type: ignore
+    assert len(m.tr_loader) == math.ceil(len(m.tr_data) / m.tr_loader.batch_size)
+    cflearn._rmtree(logging_folder)
+    os.remove(npy_file)
+
+
 if __name__ == "__main__":
     test_array_dataset()
+    test_data_residency()
+    test_feature_store()
+    test_mmap_data()
+    test_view_split()
+    test_parallel_read()
+    test_hash_embedding()
+    test_background_prefetch()
+    test_one_hot_cache()
+    test_finetune()
     test_file_dataset()
     test_file_dataset2()
+    test_stream_dataset()
     test_auto_file()